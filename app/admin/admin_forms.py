@@ -1,22 +1,65 @@
 """Forms for Admin page"""
+import os
+import time
+import logging
+import requests
 from wtforms import fields, validators, form as fo
 from flask_admin.model.fields import InlineFieldList
 from flask_admin.form import Select2Widget
-from cosine_search.top_results import get_all_tags_services, get_all_tags_questions
+from db.tags import SERVICE_TAGS, QUESTION_TAGS, TAGS_REFRESH_SECONDS
 
 
 # pylint: disable=W0702
 
+logger = logging.getLogger("admin_forms")
+
+API_URL = os.getenv("API_URL", "http://pocas_api/api/v1/")
+
+
+# tags fetched from the API and when, reused for TAGS_REFRESH_SECONDS
+_API_TAGS = {"tags": None, "loaded": 0.0}
+
 
 def get_service_question_tags():
-    """Return Service and Question unique tags"""
-    service_tags = get_all_tags_services()
-    question_tags = get_all_tags_questions()
+    """Return Service and Question unique tags from the API, Mongo if the API is down"""
+    if (
+        _API_TAGS["tags"] is not None
+        and time.monotonic() - _API_TAGS["loaded"] <= TAGS_REFRESH_SECONDS
+    ):
+        return _API_TAGS["tags"]
+    try:
+        resp = requests.get(f"{API_URL}tags", timeout=5)
+        resp.raise_for_status()
+        _API_TAGS["tags"] = resp.json()["tags"]
+        _API_TAGS["loaded"] = time.monotonic()
+        return _API_TAGS["tags"]
+    except Exception as e:
+        logger.warning("Could not get tags from API: %s", e)
+    service_tags = SERVICE_TAGS.get()
+    question_tags = QUESTION_TAGS.get()
     tags = sorted(set(service_tags + question_tags))
     return tags
 
 
-CHOICES = [(str(x), x) for x in get_service_question_tags()]
+# filled by refresh_tags when a form is created, nothing is queried at import
+TAGS = []
+CHOICES = []
+
+
+def refresh_tags():
+    """Refresh TAGS and CHOICES in place from the tag vocabularies"""
+    tags = get_service_question_tags()
+    if tags != TAGS:
+        TAGS[:] = tags
+        CHOICES[:] = [(str(x), x) for x in tags]
+    return TAGS
+
+
+def invalidate_tags():
+    """Reload tag vocabularies on next refresh, after a service or question was saved"""
+    _API_TAGS["tags"] = None
+    SERVICE_TAGS.invalidate()
+    QUESTION_TAGS.invalidate()
 
 
 class ServiceForm(fo.Form):
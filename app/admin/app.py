@@ -8,6 +8,7 @@ from flask_admin.contrib.pymongo import ModelView, filters
 from flask_admin.contrib import sqla
 from db.mongo_connector import MongoConnector
 from db.consts import DB_SERVICES, get_lat_lon
+from db.versions import bump_version
 from flask import url_for, redirect, request, abort
 from flask_security import hash_password
 from flask_security import current_user
@@ -18,7 +19,10 @@ from admin.admin_forms import (
     QuestionForm,
     AnalyticsForm,
     UserForm,
-    get_service_question_tags,
+    TAGS,
+    API_URL,
+    refresh_tags,
+    invalidate_tags,
 )
 
 # pylint: disable=R0902, R0912, R0913, R0914, R0915, E1101, E0611, W0223. R1725, W0221
@@ -26,8 +30,6 @@ from admin.admin_forms import (
 conn = MongoConnector().client
 db1 = conn[DB_SERVICES["db"]]
 
-TAGS = get_service_question_tags()
-
 
 class MyModelView(ModelView):
     """Generic Model View to include authentication"""
@@ -128,10 +130,12 @@ class QuestionsView(MyModelView):
         return form
 
     def create_form(self):
+        refresh_tags()
         form = super(QuestionsView, self).create_form()
         return self._feed_tag_choices(form)
 
     def edit_form(self, obj):
+        refresh_tags()
         form = super(QuestionsView, self).edit_form(obj)
         return self._feed_tag_choices(form)
 
@@ -144,6 +148,16 @@ class QuestionsView(MyModelView):
 
         return model
 
+    def after_model_change(self, form, model, is_created):
+        """Bump questions version so API snapshots refresh, reload tag choices"""
+        bump_version("questions", ids=[model["_id"]])
+        invalidate_tags()
+
+    def after_model_delete(self, model):
+        """Bump questions version so API snapshots refresh"""
+        bump_version("questions", ids=[model["_id"]])
+        invalidate_tags()
+
 
 class ServicesView(MyModelView):
     """POCAS Services"""
@@ -184,15 +198,27 @@ class ServicesView(MyModelView):
         # TODO: trigger model training through rabbitmq
         return model
 
+    def after_model_change(self, form, model, is_created):
+        """Patch API snapshots with the service, reload tag choices"""
+        bump_version(DB_SERVICES["collection"], ids=[model["_id"]])
+        invalidate_tags()
+
+    def after_model_delete(self, model):
+        """Remove the service from API snapshots"""
+        bump_version(DB_SERVICES["collection"], ids=[model["_id"]])
+        invalidate_tags()
+
     def _feed_tag_choices(self, form):
         form.general_topic.choices = [(str(x), x) for x in TAGS]
         return form
 
     def create_form(self):
+        refresh_tags()
         form = super(ServicesView, self).create_form()
         return self._feed_tag_choices(form)
 
     def edit_form(self, obj):
+        refresh_tags()
         form = super(ServicesView, self).edit_form(obj)
         return self._feed_tag_choices(form)
 
@@ -286,7 +312,7 @@ class DisconnectedServicesView(SuperUserBaseView):
     @expose("/")
     def index(self):
         """Get Disconnected Services View"""
-        api_url = "http://pocas_api/api/v1/"
+        api_url = API_URL
         s = requests.Session()
         s.auth = (os.getenv("API_USER"), os.getenv("API_PASS"))
         data = s.get(f"{api_url}alarms/disconnected", timeout=10).json()
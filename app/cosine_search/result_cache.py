@@ -0,0 +1,59 @@
+"""Redis Cache of top_n Results of identical Questionnaires"""
+import os
+from db.geocode import normalize_address
+
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "3600"))
+
+
+class ResultCache:
+    """
+    top_n results keyed by everything they depend on: address, age tag, tags of answers, top_n,
+    scorer and the content digests of the services and questions snapshots.
+
+    A content change changes every key so stale results are never read, they expire after the TTL.
+    Version bumps that leave the content as is keep the cached results.
+    Backed by a RedisCache namespace, disabled until `init`.
+    """
+
+    def __init__(self, ttl=RESULT_CACHE_TTL):
+        self.ttl = ttl
+        self.cache = None
+
+    def init(self, cache):
+        """Use RedisCache namespace"""
+        self.cache = cache
+
+    @staticmethod
+    def key(gtr, services, questions):
+        """
+        Cache key parts of user results
+
+        :param gtr: GetTopNResults
+        :param services: ServicesSnapshot
+        :param questions: QuestionsSnapshot
+        :return: tuple of str
+        """
+        return (
+            f"s{services.digest}",
+            f"q{questions.digest}",
+            normalize_address(gtr.address),
+            gtr.age_tag,
+            format(questions.answers_mask(gtr.answers), "x"),
+            str(int(gtr.top_n)),
+            gtr.scorer.name,
+        )
+
+    async def get(self, key):
+        """Cached results of key, None on miss"""
+        if self.cache is None:
+            return None
+        return await self.cache.get(*key)
+
+    async def set(self, key, value):
+        """Cache results of key for ttl seconds"""
+        if self.cache is None:
+            return
+        await self.cache.set(*key, value=value, ttl=self.ttl)
+
+
+RESULT_CACHE = ResultCache()
@@ -0,0 +1,184 @@
+"""Pluggable Scorers ranking Services of a Snapshot for a User"""
+import os
+import json
+import logging
+from typing import Dict, Protocol, Type
+
+import numpy as np
+
+from cosine_search.service_matrix import DISTANCE_WEIGHT, distance_decay
+
+# pylint: disable=R0903, R0913, W0613
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("scorers")
+
+SCORER = os.getenv("SCORER", "cosine")
+COSINE_DISTANCE_WEIGHT = float(
+    os.getenv("COSINE_DISTANCE_WEIGHT", str(DISTANCE_WEIGHT))
+)
+COSINE_DECAY_MILES = float(os.getenv("COSINE_DECAY_MILES", "100"))
+DECAY_MILES = float(os.getenv("SCORER_DECAY_MILES", "50"))
+TAG_WEIGHTS_FILE = os.getenv("SCORER_TAG_WEIGHTS_FILE", "/data/tag_weights.json")
+
+
+class Scorer(Protocol):
+    """
+    Scores services of a ServiceMatrix for users.
+
+    `score` scores rows for one user, `score_many` scores all services for many users, higher
+    is better. Scorers only read the precomputed arrays of the matrix.
+    """
+
+    name: str
+
+    def score(self, matrix, rows, distances, tag_ids):
+        """
+        :param matrix: ServiceMatrix
+        :param rows: row indices to score
+        :param distances: np.array of haversine distances in meters to the user aligned with
+            rows, NaN for online services
+        :param tag_ids: user tag ids from `ServiceMatrix.tag_ids`
+        :return: np.array of scores aligned with rows
+        """
+
+    def score_many(self, matrix, distances, tag_ids, candidates):
+        """
+        :param matrix: ServiceMatrix
+        :param distances: np.array (services x users) of haversine distances in meters,
+            NaN for online services
+        :param tag_ids: list of user tag ids per user
+        :param candidates: bool np.array (services x users) of services scored for each user
+        :return: np.array (services x users) of scores
+        """
+
+
+SCORERS: Dict[str, Type[Scorer]] = {}
+# scorers are built once per process and shared, scoring only reads them
+_SCORER_INSTANCES: Dict[str, Scorer] = {}
+
+
+def register_scorer(cls):
+    """Register Scorer class by its name"""
+    SCORERS[cls.name] = cls
+    return cls
+
+
+def get_scorer(name=None):
+    """Get shared Scorer by name, SCORER env if None, built on first use"""
+    name = name or SCORER
+    if name not in SCORERS:
+        raise Exception(f"Unknown scorer {name}, choose one of {sorted(SCORERS)}!")
+    if name not in _SCORER_INSTANCES:
+        _SCORER_INSTANCES[name] = SCORERS[name]()
+    return _SCORER_INSTANCES[name]
+
+
+def score_each(scorer, matrix, distances, tag_ids, candidates):
+    """score_many of a scorer by scoring the candidates of each user with score"""
+    scores = np.zeros(candidates.shape, dtype=np.float64)
+    for i, user_tag_ids in enumerate(tag_ids):
+        rows = np.flatnonzero(candidates[:, i])
+        scores[rows, i] = scorer.score(matrix, rows, distances[rows, i], user_tag_ids)
+    return scores
+
+
+@register_scorer
+class CosineScorer:
+    """Cosine Similarity of one-hot tags decayed by distance, the POCAS score"""
+
+    name = "cosine"
+
+    def __init__(
+        self, distance_weight=COSINE_DISTANCE_WEIGHT, decay_miles=COSINE_DECAY_MILES
+    ):
+        self.distance_weight = distance_weight
+        self.decay_meters = decay_miles * 1609
+
+    def score(self, matrix, rows, distances, tag_ids):
+        """Cosine Similarity of user against services in rows"""
+        return matrix.score(
+            rows, distances, tag_ids, self.distance_weight, self.decay_meters
+        )
+
+    def score_many(self, matrix, distances, tag_ids, candidates):
+        """Cosine Similarity of many users against all services"""
+        return matrix.score_many(
+            distances, tag_ids, self.distance_weight, self.decay_meters
+        )
+
+
+@register_scorer
+class DistanceDecayScorer:
+    """
+    Share of user tags a service has, decayed by exp(-distance / decay) of its haversine
+    distance to the user. Online services are not decayed.
+    """
+
+    name = "distance_decay"
+
+    def __init__(self, decay_miles=DECAY_MILES):
+        self.decay_meters = decay_miles * 1609
+
+    def score(self, matrix, rows, distances, tag_ids):
+        """Decayed tag overlap of user against services in rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        overlap = matrix.matrix[np.ix_(rows, tag_ids)].sum(axis=1)
+        overlap /= max(len(tag_ids), 1)
+        return overlap * distance_decay(distances, self.decay_meters)
+
+    def score_many(self, matrix, distances, tag_ids, candidates):
+        """Decayed tag overlap of many users against their candidate services"""
+        return score_each(self, matrix, distances, tag_ids, candidates)
+
+
+def load_tag_weights(file=TAG_WEIGHTS_FILE):
+    """Learned tag weights from json file of {tag: weight}, empty if there is no file"""
+    try:
+        with open(file, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning("Could not load tag weights %s: %s", file, e)
+        return {}
+
+
+@register_scorer
+class WeightedDotScorer:
+    """
+    Sparse dot product of user tags and service tags with a weight per tag, normalized by the
+    weights of the user tags.
+
+    Weights come from SCORER_TAG_WEIGHTS_FILE, tags without a learned weight get their
+    inverse service frequency so rare tags count more.
+    """
+
+    name = "weighted_dot"
+
+    def __init__(self, tag_weights=None):
+        self.tag_weights = load_tag_weights() if tag_weights is None else tag_weights
+
+    def weights(self, matrix, tag_ids):
+        """Weights of tag ids"""
+        idf = np.log((1 + len(matrix.rows)) / (1 + matrix.tag_totals[tag_ids])) + 1
+        return np.array(
+            [
+                self.tag_weights.get(matrix.tags[t], w)
+                for t, w in zip(tag_ids.tolist(), idf.tolist())
+            ],
+            dtype=np.float64,
+        )
+
+    def score(self, matrix, rows, distances, tag_ids):
+        """Weighted tag dot product of user against services in rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        weights = self.weights(matrix, tag_ids)
+        total = np.sum(np.abs(weights))
+        if total == 0:
+            return np.zeros(len(rows), dtype=np.float64)
+        return matrix.matrix[np.ix_(rows, tag_ids)] @ weights / total
+
+    def score_many(self, matrix, distances, tag_ids, candidates):
+        """Weighted tag dot product of many users against their candidate services"""
+        return score_each(self, matrix, distances, tag_ids, candidates)
@@ -0,0 +1,247 @@
+"""Precomputed Tag Matrix of all Services for Scoring"""
+import copy
+import numpy as np
+
+# pylint: disable=R0902, R0903
+
+DISTANCE_WEIGHT = 0.1
+DECAY_METERS = 100 * 1609
+
+
+def distance_decay(distances, decay_meters=DECAY_METERS):
+    """exp(-distance / decay_meters), distances of NaN (online services) are not decayed"""
+    return np.exp(-np.nan_to_num(distances, nan=0.0) / decay_meters)
+
+
+def service_id(doc):
+    """Get str id of Service whether it came from Mongo raw or from `query_results_api`"""
+    if "_id" in doc:
+        return str(doc["_id"])
+    return str(doc["id"])
+
+
+def coordinate(value):
+    """Float lat/lon, NaN if missing"""
+    return np.nan if value is None else float(value)
+
+
+def service_tags(doc):
+    """Tags of Service including General Topic"""
+    tags = set(doc.get("tags") or [])
+    if doc.get("general_topic") is not None:
+        tags.add(doc["general_topic"])
+    return tags
+
+
+def top_k(scores, groups, k):
+    """
+    Positions of the k best scores with at most one position per group, in the same order as a
+    stable descending sort deduped by group, without sorting all scores.
+
+    Only scores at or above the k-th best are sorted, k grows until k groups are found.
+
+    :param scores: np.array of scores
+    :param groups: np.array of group ids aligned with scores
+    :param k: number of positions
+    :return: np.array of positions
+    """
+    n = len(scores)
+    k = min(k, n)
+    size = k
+    while True:
+        if size >= n:
+            candidates = np.arange(n)
+        else:
+            kth = np.partition(-scores, size - 1)[size - 1]
+            candidates = np.flatnonzero(-scores <= kth)
+        order = candidates[np.lexsort((candidates, -scores[candidates]))]
+        _, first = np.unique(groups[order], return_index=True)
+        picked = order[np.sort(first)][:k]
+        if len(picked) >= k or size >= n:
+            return picked
+        size *= 2
+
+
+class ServiceMatrix:
+    """
+    One-hot Tag Matrix of all Services plus Lat/Lon columns.
+
+    Built once from the services collection, a user is scored against it as a single
+    matrix-vector product instead of building a DataFrame and a full cosine matrix per request.
+    Single services are patched with `upsert`/`delete` on a `copy`, deleted services keep an
+    empty row until the next full build.
+    """
+
+    def __init__(self, services):
+        self.ids = [service_id(s) for s in services]
+        self.rows = {_id: i for i, _id in enumerate(self.ids)}
+        doc_tags = [service_tags(s) for s in services]
+        self.tags = sorted(set().union(*doc_tags)) if doc_tags else []
+        self.tag_index = {tag: i for i, tag in enumerate(self.tags)}
+
+        self.matrix = np.zeros((len(services), len(self.tags)), dtype=np.float64)
+        for row, tags in enumerate(doc_tags):
+            self.matrix[row, [self.tag_index[t] for t in tags]] = 1
+        self.tag_counts = self.matrix.sum(axis=1)
+        self.tag_totals = self.matrix.sum(axis=0)
+
+        # services with the same name share a group, only the best of a group is ranked
+        self.names = {}
+        self.name_groups = np.array(
+            [self.name_group(s) for s in services],
+            dtype=np.int64,
+        )
+
+        self.lat = np.array([coordinate(s.get("lat")) for s in services])
+        self.lon = np.array([coordinate(s.get("lon")) for s in services])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def name_group(self, doc):
+        """Name group id of service"""
+        return self.names.setdefault(doc.get("name"), len(self.names))
+
+    def copy(self):
+        """Copy with its own arrays"""
+        other = copy.copy(self)
+        other.ids = list(self.ids)
+        other.rows = dict(self.rows)
+        other.tags = list(self.tags)
+        other.tag_index = dict(self.tag_index)
+        other.names = dict(self.names)
+        for name in ("matrix", "tag_counts", "tag_totals", "name_groups", "lat", "lon"):
+            setattr(other, name, getattr(self, name).copy())
+        return other
+
+    def add_tags(self, tags):
+        """Add columns of tags not in the tag space yet"""
+        new_tags = sorted(set(tags) - set(self.tag_index))
+        if not new_tags:
+            return
+        self.tag_index.update({t: len(self.tags) + i for i, t in enumerate(new_tags)})
+        self.tags.extend(new_tags)
+        self.matrix = np.hstack((self.matrix, np.zeros((len(self), len(new_tags)))))
+        self.tag_totals = np.concatenate((self.tag_totals, np.zeros(len(new_tags))))
+
+    def clear_row(self, row):
+        """Empty tags and location of row"""
+        self.tag_totals -= self.matrix[row]
+        self.matrix[row] = 0
+        self.tag_counts[row] = 0
+        self.lat[row] = np.nan
+        self.lon[row] = np.nan
+        self.name_groups[row] = -1
+
+    def upsert(self, doc):
+        """
+        Set row of service, appended if it is new
+
+        :return: row of service
+        """
+        _id = service_id(doc)
+        row = self.rows.get(_id)
+        if row is None:
+            row = len(self)
+            self.ids.append(_id)
+            self.rows[_id] = row
+            self.matrix = np.vstack((self.matrix, np.zeros((1, len(self.tags)))))
+            self.tag_counts = np.append(self.tag_counts, 0.0)
+            self.name_groups = np.append(self.name_groups, -1)
+            self.lat = np.append(self.lat, np.nan)
+            self.lon = np.append(self.lon, np.nan)
+        self.clear_row(row)
+        tags = service_tags(doc)
+        self.add_tags(tags)
+        self.matrix[row, [self.tag_index[t] for t in tags]] = 1
+        self.tag_counts[row] = len(tags)
+        self.tag_totals += self.matrix[row]
+        self.name_groups[row] = self.name_group(doc)
+        self.lat[row] = coordinate(doc.get("lat"))
+        self.lon[row] = coordinate(doc.get("lon"))
+        return row
+
+    def delete(self, _id):
+        """
+        Empty row of service id
+
+        :return: row of service, None if it is not in the matrix
+        """
+        row = self.rows.pop(_id, None)
+        if row is not None:
+            self.ids[row] = None
+            self.clear_row(row)
+        return row
+
+    def tag_ids(self, tags):
+        """Sorted column ids of tags in the matrix tag space, unknown tags are dropped"""
+        return np.array(
+            sorted({self.tag_index[t] for t in tags if t in self.tag_index}),
+            dtype=np.int64,
+        )
+
+    def user_vector(self, tag_ids):
+        """One-hot vector of user tag ids"""
+        vector = np.zeros(len(self.tags), dtype=np.float64)
+        vector[tag_ids] = 1
+        return vector
+
+    @staticmethod
+    def decay(distances, distance_weight, decay_meters):
+        """Distance factor of cosine, from 1 at the user down to 1 - distance_weight"""
+        return (
+            1
+            - distance_weight
+            + distance_weight * distance_decay(distances, decay_meters)
+        )
+
+    def score(
+        self,
+        rows,
+        distances,
+        tag_ids,
+        distance_weight=DISTANCE_WEIGHT,
+        decay_meters=DECAY_METERS,
+    ):
+        """
+        Cosine Similarity of user tags against tags of services in rows, decayed by distance.
+
+        `cosine * (1 - distance_weight + distance_weight * exp(-distance / decay_meters))`,
+        tag norms come from the precomputed tag counts so no matrix is built.
+
+        :param rows: row indices to score
+        :param distances: np.array of haversine distances in meters aligned with rows,
+            NaN for online services
+        :param tag_ids: user tag ids from `tag_ids`
+        :param distance_weight: share of the score decayed by distance
+        :param decay_meters: distance where decay is 1/e
+        :return: np.array of scores aligned with rows
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return np.zeros(0, dtype=np.float64)
+        dot = self.matrix[np.ix_(rows, tag_ids)].sum(axis=1)
+        norm = np.sqrt(self.tag_counts[rows] * len(tag_ids))
+        cosine = dot / np.maximum(norm, np.finfo(np.float64).eps)
+        return cosine * self.decay(distances, distance_weight, decay_meters)
+
+    def score_many(
+        self,
+        distances,
+        tag_ids,
+        distance_weight=DISTANCE_WEIGHT,
+        decay_meters=DECAY_METERS,
+    ):
+        """
+        Decayed Cosine Similarity of many users against all services as one matrix-matrix product.
+
+        :param distances: np.array (services x users) of haversine distances in meters,
+            NaN for online services
+        :param tag_ids: list of user tag ids per user
+        :return: np.array (services x users) of scores
+        """
+        users = np.stack([self.user_vector(t) for t in tag_ids], axis=1)
+        dot = self.matrix @ users
+        norm = np.sqrt(self.tag_counts[:, None] * users.sum(axis=0)[None, :])
+        cosine = dot / np.maximum(norm, np.finfo(np.float64).eps)
+        return cosine * self.decay(distances, distance_weight, decay_meters)
@@ -0,0 +1,242 @@
+"""In-Memory Snapshots of Services and Questions Collections"""
+import copy
+import json
+import gzip
+import hashlib
+import logging
+import numpy as np
+from bson import ObjectId
+from pydantic import ValidationError
+from db.consts import DB_SERVICES
+from db.mongo_connector import MongoConnector
+from db.versions import SnapshotRegistry
+from cosine_search.service_matrix import ServiceMatrix, service_id, service_tags
+from cosine_search.tag_index import TagIndex
+from cosine_search.spatial_index import SpatialGrid
+from models import Service
+
+# pylint: disable=R0903
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("snapshot")
+
+
+def digest(value):
+    """Short stable hash of value"""
+    data = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.md5(data).hexdigest()[:16]
+
+
+def encode_service(service):
+    """Service validated and encoded as in a FullServices response, None if it is invalid"""
+    try:
+        return Service(**service).json().encode("utf-8")
+    except ValidationError as e:
+        logger.warning("Skip invalid service %s: %s", service_id(service), e)
+        return None
+
+
+def fragment_hash(encoded):
+    """64 bit hash of an encoded service, 0 for an empty row"""
+    if encoded is None:
+        return 0
+    return int.from_bytes(hashlib.md5(encoded).digest()[:8], "big")
+
+
+class ServicesSnapshot:
+    """
+    All Services at a version with structures derived from them.
+
+    Services that fail validation are left out. `patched` applies single service changes to copies
+    of the structures, rows of deleted services stay empty (None in services) until the next full
+    build. The copies keep readers of the current snapshot consistent, they are O(N) per patch but
+    skip the Mongo reload and validation of all services. The response body is only built for the
+    first unfiltered request of a snapshot.
+    """
+
+    def __init__(self, version, services):
+        self.version = version
+        # validated and encoded once, served as is for unfiltered services
+        encoded = [encode_service(s) for s in services]
+        self.services = [s for s, e in zip(services, encoded) if e is not None]
+        self.encoded = [e for e in encoded if e is not None]
+        self.matrix = ServiceMatrix(self.services)
+        self.tag_index = TagIndex(self.matrix)
+        self.spatial = SpatialGrid(self.matrix.lat, self.matrix.lon)
+        # sum of fragment hashes, patched per changed service
+        self.hash_sum = sum(map(fragment_hash, self.encoded)) % 2**64
+        self.reset()
+
+    def __len__(self):
+        return len(self.services)
+
+    def reset(self):
+        """Online mask of current services, response bodies are built again on first use"""
+        self.online = np.isnan(self.matrix.lat) | np.isnan(self.matrix.lon)
+        self._body = None
+        self._body_gzip = None
+
+    @property
+    def digest(self):
+        """Hash of the encoded services, independent of their rows"""
+        return format(self.hash_sum, "016x")
+
+    @property
+    def body(self):
+        """FullServices response body of current services"""
+        if self._body is None:
+            encoded = [e for e in self.encoded if e is not None]
+            self._body = b'{"services": [%s], "num_of_services": %d}' % (
+                b", ".join(encoded),
+                len(encoded),
+            )
+        return self._body
+
+    @property
+    def body_gzip(self):
+        """Gzipped FullServices response body"""
+        if self._body_gzip is None:
+            self._body_gzip = gzip.compress(self.body, mtime=0)
+        return self._body_gzip
+
+    def response_body(self, gzipped=False):
+        """Response body, gzipped or not, built if this snapshot was not served yet"""
+        return self.body_gzip if gzipped else self.body
+
+    def patched(self, version, ids, docs):
+        """
+        Snapshot at version with services of ids replaced by docs, ids without a doc are deleted
+
+        :param version: version of the new snapshot
+        :param ids: str ids of changed services
+        :param docs: current documents of changed services still in the collection
+        :return: ServicesSnapshot
+        """
+        # copies, the current snapshot is still read by requests while patching
+        other = copy.copy(self)
+        other.version = version
+        other.services = list(self.services)
+        other.encoded = list(self.encoded)
+        other.matrix = self.matrix.copy()
+        other.tag_index = self.tag_index.copy()
+        other.spatial = self.spatial.copy()
+        docs = {service_id(d): d for d in docs}
+        for _id in ids:
+            doc = docs.get(_id)
+            encoded = None if doc is None else encode_service(doc)
+            if encoded is None:
+                # deleted or no longer valid
+                doc = None
+                row = other.matrix.delete(_id)
+                if row is None:
+                    continue
+                tags = set()
+            else:
+                row = other.matrix.upsert(doc)
+                tags = service_tags(doc)
+                if row == len(other.services):
+                    other.services.append(None)
+                    other.encoded.append(None)
+            other.hash_sum = (
+                other.hash_sum
+                - fragment_hash(other.encoded[row])
+                + fragment_hash(encoded)
+            ) % 2**64
+            other.services[row] = doc
+            other.encoded[row] = encoded
+            other.tag_index.set_row(row, tags)
+            other.spatial.set_point(row, other.matrix.lat[row], other.matrix.lon[row])
+        other.reset()
+        return other
+
+    def filter_tag(self, tag):
+        """Services with tag in tags or general topic"""
+        return [self.services[i] for i in self.tag_index.rows_any([tag])]
+
+    def etag(self, tag=None):
+        """ETag of services response, optionally filtered by tag"""
+        if tag:
+            return f'"{self.digest}-{digest(tag)[:8]}"'
+        return f'"{self.digest}"'
+
+
+def load_services_snapshot(version):
+    """Load all Services from Mongo in a snapshot"""
+    m = MongoConnector()
+    services = m.query_results_api(
+        db=DB_SERVICES["db"],
+        collection=DB_SERVICES["collection"],
+        query={},
+        exclude={"loc": 0},
+    )
+    return ServicesSnapshot(version, services)
+
+
+def patch_services_snapshot(snapshot, version, ids):
+    """Patch snapshot to version with only the changed Services from Mongo"""
+    m = MongoConnector()
+    docs = m.query_results_api(
+        db=DB_SERVICES["db"],
+        collection=DB_SERVICES["collection"],
+        query={
+            "_id": {"$in": [ObjectId(i) if ObjectId.is_valid(i) else i for i in ids]}
+        },
+        exclude={"loc": 0},
+    )
+    return snapshot.patched(version, ids, docs)
+
+
+SERVICES_SNAPSHOT = SnapshotRegistry(
+    DB_SERVICES["collection"], load_services_snapshot, patcher=patch_services_snapshot
+)
+
+
+class QuestionsSnapshot:
+    """
+    All Questions at a version sorted by id.
+
+    Tags of each question are precomputed as a bitmask over the question tags, answers map to tags
+    with an OR of the masks of questions answered yes.
+    """
+
+    def __init__(self, version, questions):
+        self.version = version
+        self.questions = sorted(questions, key=lambda q: q["id"])
+        self.tag_names = sorted({t for q in self.questions for t in q.get("tags", [])})
+        bits = {tag: 1 << i for i, tag in enumerate(self.tag_names)}
+        self.masks = [
+            sum(bits[t] for t in set(q.get("tags", []))) for q in self.questions
+        ]
+        # changes only with the content of questions, not with version bumps
+        self.digest = digest(self.questions)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def answers_mask(self, answers):
+        """Bitmask of tags of questions answered yes"""
+        mask = 0
+        for question_mask, answer in zip(self.masks, answers):
+            if answer:
+                mask |= question_mask
+        return mask
+
+    def mask_tags(self, mask):
+        """Tag names in bitmask"""
+        return [tag for i, tag in enumerate(self.tag_names) if mask >> i & 1]
+
+    def answer_tags(self, answers):
+        """Tags of questions answered yes"""
+        return self.mask_tags(self.answers_mask(answers))
+
+
+def load_questions_snapshot(version):
+    """Load all Questions from Mongo in a snapshot"""
+    m = MongoConnector()
+    questions = m.query_results_api(
+        db=DB_SERVICES["db"], collection="questions", query={}
+    )
+    return QuestionsSnapshot(version, questions)
+
+
+QUESTIONS_SNAPSHOT = SnapshotRegistry("questions", load_questions_snapshot)
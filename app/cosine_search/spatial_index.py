@@ -0,0 +1,111 @@
+"""In-Memory Geospatial Index of Services for Radius Queries"""
+import copy
+import math
+from collections import defaultdict
+import numpy as np
+
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_DEGREE = EARTH_RADIUS_METERS * math.pi / 180
+
+
+def haversine(lat, lon, lats, lons):
+    """
+    Great circle distance in meters from one point to arrays of points
+
+    :param lat: latitude of point
+    :param lon: longitude of point
+    :param lats: np.array of latitudes
+    :param lons: np.array of longitudes
+    :return: np.array of distances in meters
+    """
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = (
+        np.sin((lats - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class SpatialGrid:
+    """
+    Grid of cell_deg x cell_deg lat/lon cells holding service rows.
+
+    A radius query only looks at rows in cells overlapping the bounding box of the circle and
+    filters them with a vectorized haversine. Services without lat/lon (online) are not indexed.
+    """
+
+    def __init__(self, lat, lon, cell_deg=1.0):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.cell_deg = cell_deg
+        self.n_lon_cells = int(math.ceil(360 / cell_deg))
+        self.cells = defaultdict(list)
+        for row in np.flatnonzero(~(np.isnan(self.lat) | np.isnan(self.lon))):
+            self.cells[self.cell(self.lat[row], self.lon[row])].append(int(row))
+
+    def copy(self):
+        """Copy with its own arrays"""
+        other = copy.copy(self)
+        other.lat = self.lat.copy()
+        other.lon = self.lon.copy()
+        other.cells = defaultdict(list, {k: list(v) for k, v in self.cells.items()})
+        return other
+
+    def set_point(self, row, lat, lon):
+        """Move row to lat/lon, NaN removes it from the grid"""
+        if row >= len(self.lat):
+            grow = np.full(row + 1 - len(self.lat), np.nan)
+            self.lat = np.concatenate((self.lat, grow))
+            self.lon = np.concatenate((self.lon, grow))
+        if not (np.isnan(self.lat[row]) or np.isnan(self.lon[row])):
+            self.cells[self.cell(self.lat[row], self.lon[row])].remove(row)
+        self.lat[row] = lat
+        self.lon[row] = lon
+        if not (np.isnan(lat) or np.isnan(lon)):
+            self.cells[self.cell(lat, lon)].append(row)
+
+    def cell(self, lat, lon):
+        """Cell of lat/lon"""
+        return (
+            int(math.floor(lat / self.cell_deg)),
+            int(math.floor((lon + 180) / self.cell_deg)) % self.n_lon_cells,
+        )
+
+    def candidates(self, lat, lon, meters):
+        """Rows in cells overlapping bounding box of circle"""
+        d_lat = meters / METERS_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(abs(lat) + d_lat, 90)))
+        d_lon = 180 if cos_lat < 1e-6 else min(d_lat / cos_lat, 180)
+        lat_min, _ = self.cell(lat - d_lat, lon)
+        lat_max, _ = self.cell(lat + d_lat, lon)
+        _, lon_min = self.cell(lat, lon - d_lon)
+        n_lon = min(
+            int(math.floor((lon + d_lon + 180) / self.cell_deg))
+            - int(math.floor((lon - d_lon + 180) / self.cell_deg))
+            + 1,
+            self.n_lon_cells,
+        )
+        rows = []
+        for i in range(lat_min, lat_max + 1):
+            for j in range(n_lon):
+                rows.extend(self.cells.get((i, (lon_min + j) % self.n_lon_cells), []))
+        return np.array(rows, dtype=np.int64)
+
+    def within(self, lat, lon, meters):
+        """
+        Rows within meters of lat/lon sorted by distance
+
+        :return: tuple of np.array rows and np.array distances in meters
+        """
+        rows = self.candidates(lat, lon, meters)
+        distances = haversine(lat, lon, self.lat[rows], self.lon[rows])
+        keep = distances <= meters
+        rows, distances = rows[keep], distances[keep]
+        order = np.argsort(distances, kind="stable")
+        return rows[order], distances[order]
+
+    def any_within(self, lat, lon, meters):
+        """Check if any row is within meters of lat/lon"""
+        rows, _ = self.within(lat, lon, meters)
+        return len(rows) > 0
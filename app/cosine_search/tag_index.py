@@ -0,0 +1,55 @@
+"""Inverted Index of Tags to Services"""
+import numpy as np
+
+
+class TagIndex:
+    """
+    Tag -> bitset of service rows, built from the one-hot columns of a ServiceMatrix.
+
+    Tag filters are unions of bitsets instead of scanning every service.
+    """
+
+    def __init__(self, matrix):
+        self.size = len(matrix)
+        self.bits = {
+            tag: np.ascontiguousarray(matrix.matrix[:, i] > 0)
+            for tag, i in matrix.tag_index.items()
+        }
+
+    def copy(self):
+        """Copy with its own arrays"""
+        other = TagIndex.__new__(TagIndex)
+        other.size = self.size
+        other.bits = {tag: bits.copy() for tag, bits in self.bits.items()}
+        return other
+
+    def set_row(self, row, tags):
+        """Set tags of row, growing the bitsets if row is new"""
+        if row >= self.size:
+            grow = row + 1 - self.size
+            self.bits = {
+                tag: np.concatenate((bits, np.zeros(grow, dtype=bool)))
+                for tag, bits in self.bits.items()
+            }
+            self.size = row + 1
+        for tag, bits in self.bits.items():
+            bits[row] = tag in tags
+        for tag in set(tags) - set(self.bits):
+            self.bits[tag] = self.empty()
+            self.bits[tag][row] = True
+
+    def empty(self):
+        """Bitset with no rows"""
+        return np.zeros(self.size, dtype=bool)
+
+    def mask_any(self, tags):
+        """Bitset of rows tagged with any of tags"""
+        mask = self.empty()
+        for tag in tags:
+            if tag in self.bits:
+                mask |= self.bits[tag]
+        return mask
+
+    def rows_any(self, tags):
+        """Rows tagged with any of tags"""
+        return np.flatnonzero(self.mask_any(tags))
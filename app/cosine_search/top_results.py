@@ -1,20 +1,17 @@
 """Get Tio Results Back"""
 from datetime import datetime
-import os
+import asyncio
 import logging
 import traceback
 
-import googlemaps
+from db.geocode import geocode
+from cosine_search.snapshot import SERVICES_SNAPSHOT, QUESTIONS_SNAPSHOT
+from cosine_search.service_matrix import top_k
+from cosine_search.scorers import get_scorer
 
-from db.consts import DB_SERVICES
-from db.mongo_connector import MongoConnector
-
-import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import Normalizer
 
-# pylint: disable=R0902, R0912, R0913, R0914, R0915, E1101, E0611, W0702
+# pylint: disable=R0902, R0912, R0913, R0914, R0915, E1101, E0611, W0702, W0236
 
 AGE_MAPPER = {
     "Elder": [51, 120],
@@ -22,59 +19,35 @@ AGE_MAPPER = {
     "Young Adult Resources": [21, 35],
     "Adolescent": [0, 20],
 }
+MAX_AGE = 120
+
+
+def build_age_tags(age_mapper=None, max_age=MAX_AGE):
+    """
+    Age tag of every age from 0 to max_age, the tag with the closest range endpoint wins,
+    ties go to the first tag of the mapper
+
+    :return: tuple of age tags indexed by age
+    """
+    age_mapper = AGE_MAPPER if age_mapper is None else age_mapper
+    age_tags = []
+    for age in range(max_age + 1):
+        distances = {
+            tag: min(abs(bound - age) for bound in bounds)
+            for tag, bounds in age_mapper.items()
+        }
+        age_tags.append(min(distances, key=distances.get))
+    return tuple(age_tags)
 
 
-def get_all_collection(collection, exclude=None):
-    """Get all Collection Documents"""
-    m = MongoConnector(fsync=True)
-    data = m.query_results_api(
-        db=DB_SERVICES["db"],
-        collection=collection,
-        query={},
-        exclude=exclude,
-    )
-    return data
-
-
-def get_all_services():
-    """Get all Services"""
-    all_services = get_all_collection(DB_SERVICES["collection"], {"loc": 0})
-    return all_services
-
-
-def get_all_questions():
-    """Get all Questions"""
-    all_questions = get_all_collection("questions")
-    return all_questions
-
-
-def get_all_tags_services():
-    """Get all tags from Collection Services"""
-    return get_all_tags_collection(main_tag="general_topic", data_exc=get_all_services)
-
-
-def get_all_tags_questions():
-    """Get all tags from collection questions"""
-    return get_all_tags_collection(main_tag="main_tag", data_exc=get_all_questions)
+AGE_TAGS = build_age_tags()
 
 
-def get_all_tags_collection(
-    main_tag="general_topic", tags="tags", data_exc=get_all_services
-):
-    """Generic Function to get all Tags"""
-    try:
-        all_data = data_exc()
-        data = pd.DataFrame(all_data)
-        g_t = data[main_tag].dropna().unique().tolist()
-        tags = data[tags].explode().dropna().unique().tolist()
-        values = set(g_t + tags)
-        values = sorted(values)
-    except:  # noqa: E722
-        values = []
-    return values
+def age_tag(age):
+    """Age tag of age in years, ages are clamped to 0 - MAX_AGE"""
+    return AGE_TAGS[min(max(int(age), 0), MAX_AGE)]
 
 
-ALL_TAGS = get_all_tags_services()
 logging.basicConfig(
     level=logging.INFO,
     format="[%(asctime)s] %(name)s [%(levelname)s]: %(message)s",
@@ -83,30 +56,31 @@ logging.basicConfig(
 
 
 class GetTopNResults:
-    """Cosine Similarity on User Results compared to Tags from Services"""
+    """Score User Results against Tags from Services, cosine similarity unless scorer is given"""
 
-    def __init__(self, top_n, dob, answers, address):
+    def __init__(self, top_n, dob, answers, address, scorer=None):
         self.top_n = top_n if top_n != 0 else 1
-        self.__address = address
+        self.scorer = get_scorer(scorer)
+        self.address = address
         self.dob = datetime.strptime(str(dob), "%m%d%Y")
         self.answers = answers
         self.lat = None
         self.lon = None
         self.age = self.get_age()
+        self.age_tag = age_tag(self.age)
         self.tags = []
+        self.radius_status = None
         self.meter_to_mile = 1609
         self.miles = 200
 
     def get_lat_lon(self):
         """
-        Get Lat/Lon of User address from Google GeoCode API
+        Get Lat/Lon of User address from cached Google GeoCode API
         """
-        if os.getenv("GOOGLE_KEY") is None:
-            raise Exception("Could not find Google Key! Set it in keys.env!")
-        gmaps = googlemaps.Client(key=os.getenv("GOOGLE_KEY"))
-        address = gmaps.geocode(self.__address)
-        self.lat = address[0]["geometry"]["location"]["lat"]
-        self.lon = address[0]["geometry"]["location"]["lng"]
+        location = geocode(self.address)
+        if location is None:
+            raise Exception(f"Could not geocode address {self.address}!")
+        self.lat, self.lon = location
 
     @staticmethod
     def log():
@@ -128,100 +102,82 @@ class GetTopNResults:
         """
         Map Questionnaire to Mapper
 
+        :param questions: QuestionsSnapshot
         :return: Array of Tags Matched
         """
-        answers = self.answers
-        age_df = pd.DataFrame(AGE_MAPPER)
-        vals = np.min(np.abs(age_df - self.age), axis=0)
-        self.log().debug(vals)
+        # add tags of questions answered yes and age tag, no dups
+        answer_tags = questions.answer_tags(self.answers)
+        if self.age_tag not in answer_tags:
+            answer_tags.append(self.age_tag)
+        return answer_tags
 
-        age_tags = vals[vals == np.min(vals)].index.values[0]
+    def meters(self):
+        """Search radius in meters"""
+        return int(self.miles * self.meter_to_mile)
 
-        # find tags from questions
+    def miles_of(self, meters):
+        """Distance in meters to miles rounded to 0.1, None if there is no distance"""
+        if np.isnan(meters):
+            return None
+        return round(float(meters) / self.meter_to_mile, 1)
 
-        # make binary to boolean
-        bool_answers = list(map(bool, answers))
-        # filter questions that were answered yes
-        answers_to_use = np.array(questions)[bool_answers]
+    def find_radius(self, snapshot=None):
+        """Find within 200 miles of services"""
+        if snapshot is None:
+            snapshot = SERVICES_SNAPSHOT.get()
+        return snapshot.spatial.any_within(self.lat, self.lon, self.meters())
 
-        # add all tags from yes answered questions
-        tags_user = []
-        for answer in answers_to_use:
-            tags_user = tags_user + answer["tags"]
+    def set_tags(self, questions):
+        """Map answers to tags, default to Public Benefits if only age tag"""
+        self.tags = self.map_answers_tags(questions)
+        if len(self.tags) <= 1:
+            self.tags.append("Public Benefits")
+        self.log().debug(self.tags)
 
-        # add question and age tags
-        answer_tags = tags_user + [age_tags]
-        # remove dups
-        answer_tags = list(set(answer_tags))
-        return answer_tags
+    def find_services(self, snapshot):
+        """
+        Rows of online services and services within miles of user, sorted by distance,
+        tagged with any of user tags
 
-    def find_radius(self):
-        """Find within 200 miles of services"""
-        m = MongoConnector()
-        db = DB_SERVICES["db"]
-        collection = DB_SERVICES["collection"]
-        query = {
-            "$geoNear": {
-                "near": {"type": "Point", "coordinates": [self.lon, self.lat]},
-                "distanceField": "dist.calculated",
-                "maxDistance": int(self.miles * self.meter_to_mile),  # in meteres
-                "spherical": True,
-            }
-        }
-        results = m.aggregate(db, collection, query=query)
-        if len(results) > 0:
-            return True
-        return False
+        :return: tuple of np.array of snapshot rows and np.array of haversine distances in
+            meters to user, NaN for online services
+        """
+        tag_mask = snapshot.tag_index.mask_any(self.tags)
+        online_rows = np.flatnonzero(tag_mask & snapshot.online)
+        near_rows, distances = snapshot.spatial.within(
+            self.lat, self.lon, self.meters()
+        )
+        self.radius_status = len(near_rows) > 0
+        keep = tag_mask[near_rows]
+        rows = np.concatenate((online_rows, near_rows[keep]))
+        distances = np.concatenate((np.full(len(online_rows), np.nan), distances[keep]))
+        return rows, distances
 
-    def run_similarity(self, results):
+    def run_similarity(self, snapshot, rows, distances, scores=None):
         """
-        run cosine similarity and euclidean distance, get top n, normalize lat/lon
-        :param results:
+        run scorer on precomputed service matrix, get top n deduped by name
+        :param snapshot: services snapshot
+        :param rows: snapshot rows to rank
+        :param distances: distances in meters of rows
+        :param scores: precomputed scores of rows, computed if None
         :return:
         """
-
-        df_results = pd.DataFrame(results)
-        df_results["tags"] = df_results.apply(
-            lambda x: x["tags"] + [x["general_topic"]], axis=1
-        )
-        dummies_tags = (
-            pd.get_dummies(df_results.tags.apply(pd.Series).stack())
-            .groupby(level=0)
-            .sum()
-        )
-        dummies_tags[dummies_tags > 1] = 1
-        # if null it is online service, put same lat/lon as user
-        df_results["lat"] = df_results.lat.fillna(self.lat)
-        df_results["lon"] = df_results.lon.fillna(self.lon)
-        matrix = pd.concat([df_results[["lat", "lon"]], dummies_tags], axis=1)
-        matrix_val = matrix.values
-        tags_unique = dummies_tags.columns.values
-        overall_length = len(tags_unique)
-
-        empty_user_tags = pd.DataFrame([np.zeros(overall_length)], columns=tags_unique)
-        for tag in self.tags:
-            if tag in empty_user_tags:
-                empty_user_tags[tag] = 1
-
-        user_vector = [self.lat, self.lon]
-        user_vector = np.concatenate((user_vector, empty_user_tags.values[0]))
-
-        sim_matrix = np.vstack((matrix_val, user_vector))
-
-        weights = np.concatenate(([0.005, 0.005], np.ones(overall_length) * 1.5))
-        sim_matrix = Normalizer().transform(sim_matrix * weights)
-        sim_values = cosine_similarity(sim_matrix)
-        self.log().debug(sim_values)
-        sim_vals = sim_values[len(df_results)][: len(df_results)]
-
-        df_results["pocas_score"] = sim_vals
-        df_results = df_results.sort_values("pocas_score", ascending=False)
-        df_results = df_results.drop_duplicates(subset="name")
-        final_results = df_results[: int(self.top_n)]
-        final_results.loc[final_results["online_service"] == 1, "lat"] = None
-        final_results.loc[final_results["online_service"] == 1, "lon"] = None
-
-        final_results = final_results.to_dict(orient="records")
+        if scores is None:
+            scores = self.scorer.score(
+                snapshot.matrix, rows, distances, snapshot.matrix.tag_ids(self.tags)
+            )
+        self.log().debug(scores)
+
+        top = top_k(scores, snapshot.matrix.name_groups[rows], int(self.top_n))
+        final_results = []
+        for i in top:
+            result = dict(snapshot.services[rows[i]])
+            result["pocas_score"] = float(scores[i])
+            result["distance"] = self.miles_of(distances[i])
+            if result.get("online_service") == 1:
+                result["lat"] = None
+                result["lon"] = None
+            final_results.append(result)
         return final_results
 
     def del_none(self, d):
@@ -240,80 +196,197 @@ class GetTopNResults:
                 self.del_none(value)
         return d
 
-    @staticmethod
-    def get_questions(mongo_connector: MongoConnector, collection="questions"):
-        """
-        Get Questions from MongoDB
-        """
-        db = mongo_connector.client[DB_SERVICES["db"]]
-        c = db[collection]
-        results = []
-        for c in c.find().sort("id"):
-            results.append(c)
-        return results
-
-    def get_top_results(self):
+    def rank_results(self, snapshot, rows, distances, scores=None):
         """
-        Return Top Services
+        Rank services with scorer, revert to distance order if it fails
 
-        :return:
+        :return: list of top services
         """
-        self.get_lat_lon()
-        m = MongoConnector()
-        questions = self.get_questions(m)
-
-        self.tags = self.map_answers_tags(questions)
-        if len(self.tags) <= 1:
-            self.tags.append("Public Benefits")
-        self.log().debug(self.tags)
-
-        # https://stackoverflow.com/questions/23188875/mongodb-unable-to-find-index-for-geonear-query
-        top_results = m.query_results(
-            db=DB_SERVICES["db"],
-            collection=DB_SERVICES["collection"],
-            query={
-                "loc": {
-                    "$near": {
-                        "$geometry": {
-                            "type": "Point",
-                            "coordinates": [self.lon, self.lat],
-                        },
-                        "$maxDistance": int(self.miles * self.meter_to_mile),
-                    }
-                },
-                "$or": [
-                    {"tags": {"$in": self.tags}},
-                    {"general_topic": {"$in": self.tags}},
-                ],
-            },
-        )
-        online_results = m.query_results(
-            db=DB_SERVICES["db"],
-            collection=DB_SERVICES["collection"],
-            query={
-                "loc": None,
-                "$or": [
-                    {"tags": {"$in": self.tags}},
-                    {"general_topic": {"$in": self.tags}},
-                ],
-            },
-        )
-        self.log().debug(self.__dict__)
-        self.log().debug(online_results)
-        self.log().debug(top_results)
-        top_results = online_results + top_results
         try:
-            final_results = self.run_similarity(top_results)
+            final_results = self.run_similarity(snapshot, rows, distances, scores)
         except Exception:
             traceback.print_exc()
             self.log().warning(
-                "Could not run cosine sim, reverting to mongo query results"
+                "Could not run %s scorer, reverting to distance order results",
+                self.scorer.name,
             )
-            final_results = top_results[: int(self.top_n)]
+            final_results = []
+            for row, distance in zip(rows[: int(self.top_n)], distances):
+                result = dict(snapshot.services[row])
+                result["distance"] = self.miles_of(distance)
+                final_results.append(result)
 
         final = []
         for final_result in final_results:
             final.append(self.del_none(final_result))
         self.log().debug(final)
+        return final
+
+    def top_services(self, snapshot):
+        """Find and rank services of snapshot for user"""
+        rows, distances = self.find_services(snapshot)
+        self.log().debug(rows)
+        return self.rank_results(snapshot, rows, distances)
 
+    def get_top_results(self, questions=None):
+        """
+        Return Top Services
+
+        :param questions: QuestionsSnapshot, current one if None
+        :return:
+        """
+        self.get_lat_lon()
+        if questions is None:
+            questions = QUESTIONS_SNAPSHOT.get()
+        self.set_tags(questions)
+        self.log().debug(self.__dict__)
+        final = self.top_services(SERVICES_SNAPSHOT.get())
         return final, {"lat": self.lat, "lon": self.lon}
+
+
+class GetTopNResultsAsync(GetTopNResults):
+    """
+    GetTopNResults for the FastAPI event loop, services and questions come from the snapshots.
+
+    Geocoding and scoring run in the default thread pool, concurrently with the snapshot load.
+    """
+
+    @staticmethod
+    async def run_in_executor(func, *args):
+        """Run blocking function in default thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    async def get_lat_lon(self):
+        """
+        Get Lat/Lon of User address without blocking the event loop
+        """
+        await self.run_in_executor(super().get_lat_lon)
+
+    async def find_radius(self, snapshot=None):
+        """Find within 200 miles of services"""
+        if snapshot is None:
+            snapshot = await SERVICES_SNAPSHOT.get_async()
+        return super().find_radius(snapshot)
+
+    async def get_top_results(self, questions=None, cache=None):
+        """
+        Return Top Services
+
+        :param questions: QuestionsSnapshot, current one if None
+        :param cache: ResultCache of identical questionnaires, a hit skips geocode and scoring
+        :return:
+        """
+        if questions is None:
+            questions = await QUESTIONS_SNAPSHOT.get_async()
+        if cache is None:
+            _, snapshot = await asyncio.gather(
+                self.get_lat_lon(), SERVICES_SNAPSHOT.get_async()
+            )
+        else:
+            snapshot = await SERVICES_SNAPSHOT.get_async()
+            key = cache.key(self, snapshot, questions)
+            cached = await cache.get(key)
+            if cached is not None:
+                self.lat, self.lon = (
+                    cached["user_loc"]["lat"],
+                    cached["user_loc"]["lon"],
+                )
+                self.radius_status = cached["radius_status"]
+                return cached["services"], cached["user_loc"]
+            await self.get_lat_lon()
+        self.set_tags(questions)
+        self.log().debug(self.__dict__)
+        final = await self.run_in_executor(self.top_services, snapshot)
+        user_loc = {"lat": self.lat, "lon": self.lon}
+        if cache is not None:
+            await cache.set(
+                key,
+                {
+                    "services": final,
+                    "user_loc": user_loc,
+                    "radius_status": self.radius_status,
+                },
+            )
+        return final, user_loc
+
+
+def rank_batch(snapshot, gtrs):
+    """
+    Find and rank services of snapshot for many users, each scorer scores all its users at once
+
+    :param snapshot: services snapshot
+    :param gtrs: list of GetTopNResults with lat/lon and tags set
+    :return: list of top services per user
+    """
+    found = [gtr.find_services(snapshot) for gtr in gtrs]
+    scorers = {}
+    for i, gtr in enumerate(gtrs):
+        scorers.setdefault(gtr.scorer.name, []).append(i)
+
+    finals = [None] * len(gtrs)
+    for users in scorers.values():
+        candidates = np.zeros((len(snapshot), len(users)), dtype=bool)
+        distances = np.full((len(snapshot), len(users)), np.nan)
+        for j, i in enumerate(users):
+            rows, user_distances = found[i]
+            candidates[rows, j] = True
+            distances[rows, j] = user_distances
+        scores = gtrs[users[0]].scorer.score_many(
+            snapshot.matrix,
+            distances,
+            [snapshot.matrix.tag_ids(gtrs[i].tags) for i in users],
+            candidates,
+        )
+        for j, i in enumerate(users):
+            rows, user_distances = found[i]
+            finals[i] = gtrs[i].rank_results(
+                snapshot, rows, user_distances, scores[rows, j]
+            )
+    return finals
+
+
+async def get_top_results_batch(gtrs, questions=None):
+    """
+    Top Services of many users, unique addresses are geocoded once
+
+    :param gtrs: list of GetTopNResultsAsync
+    :param questions: QuestionsSnapshot, current one if None
+    :return: list of (top services, user location) per user, None if address was not found
+    """
+    if questions is None:
+        questions = await QUESTIONS_SNAPSHOT.get_async()
+    addresses = sorted({gtr.address for gtr in gtrs})
+    loop = asyncio.get_running_loop()
+    snapshot, *locations = await asyncio.gather(
+        SERVICES_SNAPSHOT.get_async(),
+        *[loop.run_in_executor(None, geocode, address) for address in addresses],
+        return_exceptions=True,
+    )
+    if isinstance(snapshot, Exception):
+        raise snapshot
+    # a failed geocode only fails the users of that address
+    for i, location in enumerate(locations):
+        if isinstance(location, Exception):
+            GetTopNResults.log().warning(
+                "Could not geocode address %s: %s", addresses[i], location
+            )
+            locations[i] = None
+    locations = dict(zip(addresses, locations))
+    found = [gtr for gtr in gtrs if locations[gtr.address] is not None]
+    for gtr in found:
+        gtr.lat, gtr.lon = locations[gtr.address]
+        gtr.set_tags(questions)
+    finals = dict(
+        zip(
+            map(id, found),
+            await loop.run_in_executor(None, rank_batch, snapshot, found),
+        )
+    )
+    results = []
+    for gtr in gtrs:
+        if id(gtr) in finals:
+            results.append((finals[id(gtr)], {"lat": gtr.lat, "lon": gtr.lon}))
+        else:
+            results.append(None)
+    return results
@@ -0,0 +1,89 @@
+"""Mongo Change Stream Watcher refreshing Snapshots on Collection Changes"""
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from pymongo.errors import OperationFailure, PyMongoError
+from db.mongo_connector import MongoConnectorAsync
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("change_watcher")
+
+CHANGE_STREAM_RETRY_SECONDS = float(os.getenv("CHANGE_STREAM_RETRY_SECONDS", "10"))
+# change streams need a replica set or sharded cluster
+CHANGE_STREAM_UNSUPPORTED = {40573}
+
+
+class ChangeWatcher:
+    """
+    Background change stream on collections of a db, changes are handed to the SnapshotRegistry
+    of their collection so snapshots are rebuilt as soon as data changes.
+
+    The stream resumes after the last seen event when it drops. On a standalone Mongo, where
+    change streams are not supported, the watcher stops and registries keep polling versions.
+    """
+
+    def __init__(self, db, registries, retry_seconds=CHANGE_STREAM_RETRY_SECONDS):
+        self.db = db
+        self.registries = {r.name: r for r in registries}
+        self.retry_seconds = retry_seconds
+        self.resume_token = None
+        self.task = None
+
+    def start(self):
+        """Start watching on running event loop"""
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop watching"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    def pipeline(self):
+        """Only events of watched collections"""
+        return [{"$match": {"ns.coll": {"$in": sorted(self.registries)}}}]
+
+    async def handle(self, events):
+        """Hand events of a collection to its registry"""
+        registry = self.registries[events[0]["ns"]["coll"]]
+        try:
+            await registry.on_change(events)
+        except Exception as e:
+            logger.warning("Could not refresh %s snapshot: %s", registry.name, e)
+
+    async def watch(self):
+        """Watch until the stream drops"""
+        db = MongoConnectorAsync().client[self.db]
+        async with db.watch(self.pipeline(), resume_after=self.resume_token) as stream:
+            logger.info("Watching %s.%s", self.db, sorted(self.registries))
+            async for event in stream:
+                # coalesce a burst of changes, e.g. a bulk upload, into one refresh per collection
+                events = defaultdict(list)
+                while event is not None:
+                    events[event["ns"]["coll"]].append(event)
+                    event = await stream.try_next()
+                self.resume_token = stream.resume_token
+                for collection_events in events.values():
+                    await self.handle(collection_events)
+
+    async def run(self):
+        """Watch and resume on errors, stop if change streams are not supported"""
+        while True:
+            try:
+                await self.watch()
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED:
+                    logger.info(
+                        "Change streams not supported, polling snapshot versions: %s", e
+                    )
+                    return
+                logger.warning("Change stream failed: %s", e)
+            except PyMongoError as e:
+                logger.warning("Change stream dropped: %s", e)
+            await asyncio.sleep(self.retry_seconds)
@@ -1,7 +1,7 @@
 """Consts for Mongo, and generic functions to use"""
 import os
 import ast
-import googlemaps
+from db.geocode import geocode
 
 DB_SERVICES = {"db": "results", "collection": "services"}
 
@@ -55,11 +55,9 @@ def get_lat_lon(model):
         + " "
         + str(model.get("zip_code", ""))
     )
-    gmaps = googlemaps.Client(key=os.getenv("GOOGLE_KEY"))
-    a = gmaps.geocode(google_address)
-    if len(a) > 0:
-        lat = a[0]["geometry"]["location"]["lat"]
-        lon = a[0]["geometry"]["location"]["lng"]
+    location = geocode(google_address)
+    if location is not None:
+        lat, lon = location
         loc = [lon, lat]
         model["loc"] = loc
         model["lat"] = lat
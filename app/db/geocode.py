@@ -0,0 +1,95 @@
+"""Cached Google Maps Geocoding for API, Admin and Uploads"""
+import os
+import re
+import logging
+import datetime
+import functools
+import googlemaps
+from db.mongo_connector import MongoConnector
+from db.zip_centroids import zip_lat_lon
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("geocode")
+
+GEOCODE_CACHE = {"db": "cache", "collection": "geocodes"}
+GEOCODE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 60 * 60)))
+GEOCODE_LRU_SIZE = int(os.getenv("GEOCODE_LRU_SIZE", "2048"))
+
+_GMAPS = {}
+
+
+def normalize_address(address):
+    """Normalize Address or Zip Code to use as cache key"""
+    address = re.sub(r"\s+", " ", str(address).lower())
+    return address.strip(" ,")
+
+
+def get_gmaps():
+    """Get one Google Maps Client per process"""
+    if "client" not in _GMAPS:
+        if os.getenv("GOOGLE_KEY") is None:
+            raise Exception("Could not find Google Key! Set it in keys.env!")
+        _GMAPS["client"] = googlemaps.Client(key=os.getenv("GOOGLE_KEY"))
+    return _GMAPS["client"]
+
+
+def get_cache_collection():
+    """Mongo collection of cached geocodes, expired by TTL index on `created`"""
+    return MongoConnector().client[GEOCODE_CACHE["db"]][GEOCODE_CACHE["collection"]]
+
+
+def create_cache_index():
+    """Create TTL index for geocode cache"""
+    get_cache_collection().create_index("created", expireAfterSeconds=GEOCODE_TTL)
+
+
+def read_cache(key):
+    """Read geocode from Mongo cache, None if not cached"""
+    try:
+        return get_cache_collection().find_one({"_id": key})
+    except Exception as e:
+        logger.warning("Could not read geocode cache: %s", str(e))
+        return None
+
+
+def write_cache(key, location):
+    """Write geocode to Mongo cache"""
+    doc = {"found": location is not None, "created": datetime.datetime.utcnow()}
+    if location is not None:
+        doc["lat"], doc["lon"] = location
+    try:
+        get_cache_collection().update_one({"_id": key}, {"$set": doc}, upsert=True)
+    except Exception as e:
+        logger.warning("Could not write geocode cache: %s", str(e))
+
+
+@functools.lru_cache(maxsize=GEOCODE_LRU_SIZE)
+def _geocode(key):
+    """Geocode normalized key through in-process LRU, Mongo cache then Google API"""
+    cached = read_cache(key)
+    if cached is not None:
+        if cached["found"]:
+            return cached["lat"], cached["lon"]
+        return None
+    results = get_gmaps().geocode(key)
+    location = None
+    if len(results) > 0:
+        location = (
+            results[0]["geometry"]["location"]["lat"],
+            results[0]["geometry"]["location"]["lng"],
+        )
+    write_cache(key, location)
+    return location
+
+
+def geocode(address):
+    """
+    Get Lat/Lon of address or zip code. Bare zip codes are resolved from the zip centroid table.
+
+    :param address: address or zip code
+    :return: tuple of (lat, lon) or None if address not found
+    """
+    location = zip_lat_lon(address)
+    if location is not None:
+        return location
+    return _geocode(normalize_address(address))
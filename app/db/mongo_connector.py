@@ -2,6 +2,7 @@
 
 import os
 import logging
+import threading
 from pymongo import MongoClient, GEOSPHERE
 import motor.motor_asyncio
 
@@ -9,6 +10,62 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("MongoConnector")
 # pylint: disable=W0236
 
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_UPLOAD_BATCH_SIZE = int(os.getenv("MONGO_UPLOAD_BATCH_SIZE", "1000"))
+
+
+class MongoClients:
+    """
+    Process-wide registry of Mongo clients.
+
+    One pooled MongoClient and one Motor client are shared per uri so connectors do not each
+    open their own pool and handshake. Creation is locked so threads racing on a new uri share
+    one client instead of leaking the pools of the losers.
+    """
+
+    _clients = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def pool_options(cls, fsync):
+        """Client options from env"""
+        return {
+            "fsync": fsync,
+            "maxPoolSize": MONGO_MAX_POOL_SIZE,
+            "minPoolSize": MONGO_MIN_POOL_SIZE,
+        }
+
+    @classmethod
+    def sync_client(cls, uri, fsync=False):
+        """Get shared pymongo client"""
+        key = ("sync", uri, fsync)
+        if key not in cls._clients:
+            with cls._lock:
+                if key not in cls._clients:
+                    cls._clients[key] = MongoClient(uri, **cls.pool_options(fsync))
+        return cls._clients[key]
+
+    @classmethod
+    def async_client(cls, uri, fsync=False):
+        """Get shared Motor client"""
+        key = ("async", uri, fsync)
+        if key not in cls._clients:
+            with cls._lock:
+                if key not in cls._clients:
+                    cls._clients[key] = motor.motor_asyncio.AsyncIOMotorClient(
+                        uri, **cls.pool_options(fsync)
+                    )
+        return cls._clients[key]
+
+    @classmethod
+    def close(cls):
+        """Close all shared clients, used on app shutdown"""
+        with cls._lock:
+            for client in cls._clients.values():
+                client.close()
+            cls._clients.clear()
+
 
 class MongoConnector:
     """
@@ -22,7 +79,12 @@ class MongoConnector:
         self.__user = os.getenv("MONGO_INITDB_ROOT_USERNAME", user)
 
         self._uri = f"mongodb://{self.__user}:{self.__pass}@{self.__host}:{self.__port}"
-        self.client = MongoClient(self._uri, fsync=fsync)
+        self.client = self.get_client(self._uri, fsync)
+
+    @staticmethod
+    def get_client(uri, fsync):
+        """Shared pymongo client for uri"""
+        return MongoClients.sync_client(uri, fsync)
 
     def aggregate(self, db, collection, query):
         """
@@ -85,17 +147,32 @@ class MongoConnector:
         return results
 
     @staticmethod
-    def check_duplicates(c, data, key):
-        """Check Duplicates in Collection"""
+    def filter_duplicates(data, existing, key):
+        """Drop documents with key already in collection, repeated keys within data are kept"""
+        existing = set(existing)
         results = []
-        for d in c.find({key: data[key]}):
+        for d in data:
+            if d[key] in existing:
+                logger.info("Found Duplicates!")
+                continue
             results.append(d)
-        if len(results) > 0:
-            logger.info("Found Duplicates!")
-            return None
-        return data
+        return results
 
-    def upload_results(self, db, collection, data, geo_index=False, key="name"):
+    @staticmethod
+    def batches(data, batch_size):
+        """Split data in batches of batch_size"""
+        for i in range(0, len(data), batch_size):
+            yield data[i : i + batch_size]
+
+    def upload_results(
+        self,
+        db,
+        collection,
+        data,
+        geo_index=False,
+        key="name",
+        batch_size=MONGO_UPLOAD_BATCH_SIZE,
+    ):
         """
         Upload Results to database, collection with data as a list of dictionaries
 
@@ -108,19 +185,25 @@ class MongoConnector:
         :param geo_index: create geo_index
         :return: list of meta ids of inserted documents
         :param key: key to check for duplicates
+        :param batch_size: documents checked for duplicates and inserted per round trip
         """
         db = self.client[db]
         c = db[collection]
         if geo_index:
             c.create_index([("loc", GEOSPHERE)])
-        data_temp = []
-        for d in data:
-            duplicate_check = self.check_duplicates(c, d, key)
-            if duplicate_check:
-                data_temp.append(duplicate_check)
-        if len(data_temp) > 0:
-            result = c.insert_many(data_temp)
-            return result.inserted_ids
+        inserted_ids = []
+        # keys inserted by earlier batches of this call are not duplicates
+        inserted_keys = set()
+        for batch in self.batches(data, batch_size):
+            existing = c.distinct(key, {key: {"$in": [d[key] for d in batch]}})
+            existing = set(existing) - inserted_keys
+            data_temp = self.filter_duplicates(batch, existing, key)
+            if len(data_temp) > 0:
+                result = c.insert_many(data_temp)
+                inserted_ids.extend(result.inserted_ids)
+                inserted_keys.update(d[key] for d in data_temp)
+        if len(inserted_ids) > 0:
+            return inserted_ids
         return ["Duplicate!"]
 
 
@@ -129,9 +212,10 @@ class MongoConnectorAsync(MongoConnector):
     General MongoDB Connector
     """
 
-    def __init__(self, fsync=False, user=None, password=None):
-        super().__init__(fsync=fsync, user=user, password=password)
-        self.client = motor.motor_asyncio.AsyncIOMotorClient(self._uri, fsync=fsync)
+    @staticmethod
+    def get_client(uri, fsync):
+        """Shared Motor client for uri"""
+        return MongoClients.async_client(uri, fsync)
 
     @staticmethod
     def clean_id(document):
@@ -196,16 +280,15 @@ class MongoConnectorAsync(MongoConnector):
         results = await c.find(query, exclude).to_list(length=None)
         return results
 
-    @staticmethod
-    async def check_duplicates(c, data, key):
-        """Check Duplicates in Collection"""
-        results = await c.find({key: data[key]}).to_list(length=None)
-        if len(results) > 0:
-            logger.info("Found Duplicates!")
-            return None
-        return data
-
-    async def upload_results(self, db, collection, data, geo_index=False, key="name"):
+    async def upload_results(
+        self,
+        db,
+        collection,
+        data,
+        geo_index=False,
+        key="name",
+        batch_size=MONGO_UPLOAD_BATCH_SIZE,
+    ):
         """
         Upload Results to database, collection with data as a list of dictionaries
 
@@ -218,17 +301,23 @@ class MongoConnectorAsync(MongoConnector):
         :param geo_index: create geo_index
         :return: list of meta ids of inserted documents
         :param key: key to check for duplicates
+        :param batch_size: documents checked for duplicates and inserted per round trip
         """
         db = self.client[db]
         c = db[collection]
         if geo_index:
             await c.create_index([("loc", GEOSPHERE)])
-        data_temp = []
-        for d in data:
-            duplicate_check = await self.check_duplicates(c, d, key)
-            if duplicate_check:
-                data_temp.append(duplicate_check)
-        if len(data_temp) > 0:
-            result = await c.insert_many(data_temp)
-            return result.inserted_ids
+        inserted_ids = []
+        # keys inserted by earlier batches of this call are not duplicates
+        inserted_keys = set()
+        for batch in self.batches(data, batch_size):
+            existing = await c.distinct(key, {key: {"$in": [d[key] for d in batch]}})
+            existing = set(existing) - inserted_keys
+            data_temp = self.filter_duplicates(batch, existing, key)
+            if len(data_temp) > 0:
+                result = await c.insert_many(data_temp)
+                inserted_ids.extend(result.inserted_ids)
+                inserted_keys.update(d[key] for d in data_temp)
+        if len(inserted_ids) > 0:
+            return inserted_ids
         return ["Duplicate!"]
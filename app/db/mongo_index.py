@@ -1,10 +1,19 @@
-"""Create Text Index on Name for Services"""
-from pymongo import TEXT
+"""Create Text, Tag and Geo Indexes for Services and TTL Indexes for Geocode Cache and Change Events"""
+from pymongo import TEXT, ASCENDING, GEOSPHERE
 
 from db.mongo_connector import MongoConnector
 from db.consts import DB_SERVICES
+from db.geocode import create_cache_index
+from db.versions import create_change_events_index
 
 
 m = MongoConnector()
 services = m.client[DB_SERVICES["db"]][DB_SERVICES["collection"]]
 services.create_index([("name", TEXT)], default_language="english")
+# multikey indexes for tag filters, `$or` of tags/general_topic uses one per clause
+services.create_index([("tags", ASCENDING)])
+services.create_index([("general_topic", ASCENDING)])
+# single 2dsphere index, $geoNear fails with more than one
+services.create_index([("loc", GEOSPHERE)])
+create_cache_index()
+create_change_events_index()
@@ -0,0 +1,110 @@
+"""Shared Redis Connection Pool and namespaced msgpack Cache Client"""
+import os
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+import aioredis
+import msgpack
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("redis_cache")
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://pocas_redis:6379")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+
+
+async def create_redis(url=REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS):
+    """Redis client on a connection pool shared by the process"""
+    return await aioredis.from_url(url, max_connections=max_connections)
+
+
+async def close_redis(redis):
+    """Close Redis client and disconnect its pool"""
+    await redis.close()
+    await redis.connection_pool.disconnect()
+
+
+class CacheMetrics:
+    """Counters of cache hits, misses, sets and errors per namespace"""
+
+    def __init__(self):
+        self.counts = defaultdict(lambda: defaultdict(int))
+
+    def incr(self, namespace, name):
+        """Count one event of namespace"""
+        self.counts[namespace][name] += 1
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Counters and hit ratio per namespace"""
+        summary = {}
+        for namespace, counts in self.counts.items():
+            reads = counts["hits"] + counts["misses"]
+            summary[namespace] = dict(counts)
+            summary[namespace]["hit_ratio"] = counts["hits"] / reads if reads else None
+        return summary
+
+
+class RedisCache:
+    """
+    get/set of msgpack values under a key namespace of a shared Redis client.
+
+    Redis errors are logged and counted, a failed get is a miss and a failed set is dropped,
+    so callers can treat the cache as best effort.
+    """
+
+    def __init__(self, redis, namespace="pocas", metrics=None):
+        self.redis = redis
+        self.namespace = namespace
+        self.metrics = CacheMetrics() if metrics is None else metrics
+
+    def child(self, name) -> "RedisCache":
+        """Cache of sub namespace sharing client and metrics"""
+        return RedisCache(self.redis, f"{self.namespace}:{name}", self.metrics)
+
+    def key(self, *parts) -> str:
+        """Namespaced key of parts"""
+        return ":".join([self.namespace, *map(str, parts)])
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        """Serialize value with msgpack, unknown types as str"""
+        return msgpack.packb(value, use_bin_type=True, default=str)
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        """Deserialize msgpack value"""
+        return msgpack.unpackb(data, raw=False)
+
+    async def get(self, *parts) -> Optional[Any]:
+        """Value of key parts, None on miss"""
+        try:
+            data = await self.redis.get(self.key(*parts))
+        except Exception as e:
+            self.metrics.incr(self.namespace, "errors")
+            logger.warning("Could not read cache %s: %s", self.namespace, e)
+            return None
+        if data is None:
+            self.metrics.incr(self.namespace, "misses")
+            return None
+        self.metrics.incr(self.namespace, "hits")
+        return self.loads(data)
+
+    async def set(self, *parts, value: Any, ttl: Optional[int] = None) -> bool:
+        """Set value of key parts, expiring after ttl seconds if given"""
+        try:
+            await self.redis.set(self.key(*parts), self.dumps(value), ex=ttl)
+        except Exception as e:
+            self.metrics.incr(self.namespace, "errors")
+            logger.warning("Could not write cache %s: %s", self.namespace, e)
+            return False
+        self.metrics.incr(self.namespace, "sets")
+        return True
+
+    async def delete(self, *parts) -> None:
+        """Delete key parts"""
+        try:
+            await self.redis.delete(self.key(*parts))
+        except Exception as e:
+            self.metrics.incr(self.namespace, "errors")
+            logger.warning("Could not delete from cache %s: %s", self.namespace, e)
@@ -0,0 +1,93 @@
+"""Lazily loaded, periodically refreshed Tag Vocabulary of Collections"""
+import os
+import time
+import logging
+import threading
+from db.consts import DB_SERVICES
+from db.mongo_connector import MongoConnector, MongoConnectorAsync
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("tags")
+
+TAGS_REFRESH_SECONDS = float(os.getenv("TAGS_REFRESH_SECONDS", "300"))
+
+
+def distinct_tags(collection, main_tag, tags="tags"):
+    """Distinct values of tags and main_tag of collection, computed by Mongo"""
+    c = MongoConnector().client[DB_SERVICES["db"]][collection]
+    values = set(c.distinct(tags)) | set(c.distinct(main_tag))
+    values.discard(None)
+    values.discard("")
+    return sorted(values)
+
+
+def tag_counts_pipeline(main_tag, tags="tags"):
+    """Aggregation counting documents per tag, main_tag included and counted once per document"""
+    return [
+        {
+            "$project": {
+                "_id": 0,
+                "tag": {"$setUnion": [{"$ifNull": [f"${tags}", []]}, [f"${main_tag}"]]},
+            }
+        },
+        {"$unwind": "$tag"},
+        {"$match": {"tag": {"$nin": [None, ""]}}},
+        {"$group": {"_id": "$tag", "count": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+async def tag_counts_async(collection, main_tag):
+    """
+    Tags of collection with number of documents per tag, computed by Mongo
+
+    :return: list of dicts with tag and count sorted by tag
+    """
+    c = MongoConnectorAsync().client[DB_SERVICES["db"]][collection]
+    results = await c.aggregate(tag_counts_pipeline(main_tag)).to_list(None)
+    return [{"tag": r["_id"], "count": r["count"]} for r in results]
+
+
+class TagVocabulary:
+    """
+    Distinct tags of a collection, loaded on first use and refreshed after refresh_seconds.
+
+    Nothing is queried at import. If a refresh fails the last tags are kept.
+    """
+
+    def __init__(self, collection, main_tag, refresh_seconds=TAGS_REFRESH_SECONDS):
+        self.collection = collection
+        self.main_tag = main_tag
+        self.refresh_seconds = refresh_seconds
+        self.tags = None
+        self.loaded = 0.0
+        self.lock = threading.Lock()
+
+    def stale(self):
+        """Check if tags should be reloaded"""
+        return (
+            self.tags is None or time.monotonic() - self.loaded > self.refresh_seconds
+        )
+
+    def invalidate(self):
+        """Reload tags on next get"""
+        self.loaded = 0.0
+
+    def get(self):
+        """Sorted distinct tags"""
+        if not self.stale():
+            return self.tags
+        with self.lock:
+            if self.stale():
+                try:
+                    self.tags = distinct_tags(self.collection, self.main_tag)
+                except Exception as e:
+                    logger.warning("Could not load %s tags: %s", self.collection, e)
+                    if self.tags is None:
+                        return []
+                self.loaded = time.monotonic()
+        return self.tags
+
+
+SERVICE_TAGS = TagVocabulary(DB_SERVICES["collection"], "general_topic")
+QUESTION_TAGS = TagVocabulary("questions", "main_tag")
@@ -4,9 +4,10 @@ import ast
 import logging
 from db.mongo_connector import MongoConnector
 from db.consts import DB_SERVICES
+from db.geocode import geocode
+from db.versions import bump_version
 import pandas as pd
 import numpy as np
-import googlemaps
 from bson.objectid import ObjectId
 
 # pylint: disable=R0902, R0912, R0913, R0914, R0915, E1101, E0611, W0108. W0702
@@ -20,14 +21,11 @@ logging.basicConfig(
 
 def parse_lat_lon(row):
     """Parse Lat/Long from Address through Google API"""
-    gmaps = googlemaps.Client(key=os.getenv("GOOGLE_KEY"))
     try:
         if row["no_address"] == 0:
-            a = row["google_address"]
-            a = gmaps.geocode(a)
-            if len(a) > 0:
-                row["lat"] = a[0]["geometry"]["location"]["lat"]
-                row["lon"] = a[0]["geometry"]["location"]["lng"]
+            location = geocode(row["google_address"])
+            if location is not None:
+                row["lat"], row["lon"] = location
             row["loc"] = [row["lon"], row["lat"]]
             row["online_service"] = 0
         else:
@@ -115,6 +113,7 @@ def main():
         data=data,
         geo_index=True,
     )
+    bump_version(DB_SERVICES["collection"])
     log().info(ids)
 
 
@@ -2,6 +2,7 @@
 import logging
 from db.mongo_connector import MongoConnector
 from db.consts import DB_SERVICES
+from db.versions import bump_version
 from bson.objectid import ObjectId
 
 # pylint: disable=R0902, R0912, R0913, R0914, R0915, E1101, E0611, W0108. W0702
@@ -299,6 +300,7 @@ def main():
         geo_index=False,
         key="id",
     )
+    bump_version("questions")
 
 
 if __name__ == "__main__":
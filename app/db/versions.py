@@ -0,0 +1,255 @@
+"""Version Counters of Collections and Snapshots cached per Version"""
+import os
+import time
+import datetime
+import asyncio
+import logging
+import threading
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from db.mongo_connector import MongoConnector, MongoConnectorAsync
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("versions")
+
+DB_VERSIONS = {"db": "results", "collection": "versions"}
+DB_CHANGES = {"db": "results", "collection": "changes"}
+DB_CHANGE_EVENTS = {"db": "results", "collection": "change_events"}
+CHANGE_EVENTS_TTL = int(os.getenv("CHANGE_EVENTS_TTL", "86400"))
+SNAPSHOT_CHECK_SECONDS = float(os.getenv("SNAPSHOT_CHECK_SECONDS", "5"))
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "300"))
+SNAPSHOT_MAX_CHANGES = int(os.getenv("SNAPSHOT_MAX_CHANGES", "100"))
+
+
+def change_record(name, version, ids):
+    """Change log record of version, ids None when the whole collection may have changed"""
+    return {
+        "name": name,
+        "version": version,
+        "ids": None if ids is None else [str(i) for i in ids],
+    }
+
+
+def bump_version(name, ids=None):
+    """
+    Bump version of name after its collection changed
+
+    :param ids: ids of changed documents so snapshots can patch only them, None for any change
+    """
+    client = MongoConnector().client
+    c = client[DB_VERSIONS["db"]][DB_VERSIONS["collection"]]
+    doc = c.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    changes = client[DB_CHANGES["db"]][DB_CHANGES["collection"]]
+    changes.insert_one(change_record(name, doc["version"], ids))
+    changes.delete_many(
+        {"name": name, "version": {"$lte": doc["version"] - SNAPSHOT_MAX_CHANGES}}
+    )
+
+
+async def bump_version_async(name, ids=None):
+    """
+    Bump version of name after its collection changed
+
+    :param ids: ids of changed documents so snapshots can patch only them, None for any change
+    """
+    client = MongoConnectorAsync().client
+    c = client[DB_VERSIONS["db"]][DB_VERSIONS["collection"]]
+    doc = await c.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    changes = client[DB_CHANGES["db"]][DB_CHANGES["collection"]]
+    await changes.insert_one(change_record(name, doc["version"], ids))
+    await changes.delete_many(
+        {"name": name, "version": {"$lte": doc["version"] - SNAPSHOT_MAX_CHANGES}}
+    )
+
+
+def create_change_events_index():
+    """Create TTL index for claimed change events"""
+    c = MongoConnector().client[DB_CHANGE_EVENTS["db"]][DB_CHANGE_EVENTS["collection"]]
+    c.create_index("created", expireAfterSeconds=CHANGE_EVENTS_TTL)
+
+
+async def claim_events(events):
+    """
+    Claim change stream events by their resume token, each event is claimed by one API worker
+
+    :param events: change stream events
+    :return: events claimed by this worker
+    """
+    client = MongoConnectorAsync().client
+    c = client[DB_CHANGE_EVENTS["db"]][DB_CHANGE_EVENTS["collection"]]
+    created = datetime.datetime.utcnow()
+    try:
+        await c.insert_many(
+            [{"_id": e["_id"]["_data"], "created": created} for e in events],
+            ordered=False,
+        )
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        if any(error["code"] != 11000 for error in errors):
+            raise
+        # duplicate keys were claimed by other workers
+        taken = {error["index"] for error in errors}
+        return [event for i, event in enumerate(events) if i not in taken]
+    return events
+
+
+def get_version(name):
+    """Get current version of name, 0 if never bumped"""
+    c = MongoConnector().client[DB_VERSIONS["db"]][DB_VERSIONS["collection"]]
+    doc = c.find_one({"_id": name})
+    if doc is None:
+        return 0
+    return doc["version"]
+
+
+def get_changed_ids(name, since, version):
+    """
+    Ids of documents changed from version since to version
+
+    :return: set of str ids, None if a change has no ids or the log does not cover all versions
+    """
+    c = MongoConnector().client[DB_CHANGES["db"]][DB_CHANGES["collection"]]
+    changes = list(c.find({"name": name, "version": {"$gt": since, "$lte": version}}))
+    if len({change["version"] for change in changes}) != version - since:
+        return None
+    ids = set()
+    for change in changes:
+        if change["ids"] is None:
+            return None
+        ids.update(change["ids"])
+    return ids
+
+
+class SnapshotRegistry:
+    """
+    Holds the snapshot of a collection built by loader(version).
+
+    The version counter is checked at most every check_seconds and the snapshot is rebuilt when
+    the version changed or it is older than max_age, to catch edits that did not bump the version.
+    With a patcher(snapshot, version, ids), a version change that only touched known documents
+    patches the snapshot with those documents instead of rebuilding it.
+    If a refresh fails the last snapshot is kept.
+    """
+
+    def __init__(
+        self,
+        name,
+        loader,
+        check_seconds=SNAPSHOT_CHECK_SECONDS,
+        max_age=SNAPSHOT_MAX_AGE,
+        patcher=None,
+    ):
+        self.name = name
+        self.loader = loader
+        self.patcher = patcher
+        self.check_seconds = check_seconds
+        self.max_age = max_age
+        self.snapshot = None
+        self.checked = 0.0
+        self.built = 0.0
+        self.lock = threading.Lock()
+
+    def due(self):
+        """Check if version should be checked"""
+        return (
+            self.snapshot is None
+            or time.monotonic() - self.checked > self.check_seconds
+        )
+
+    def invalidate(self):
+        """Check version on next get"""
+        self.checked = 0.0
+
+    def get(self, force=False):
+        """
+        Get current snapshot, rebuilt if stale
+
+        :param force: rebuild even if version did not change
+        """
+        if not force and not self.due():
+            return self.snapshot
+        with self.lock:
+            if not force and not self.due():
+                return self.snapshot
+            now = time.monotonic()
+            try:
+                version = get_version(self.name)
+                if (
+                    force
+                    or self.snapshot is None
+                    or now - self.built > self.max_age
+                    or not self.patch(version)
+                ):
+                    logger.info("Build %s snapshot version %s", self.name, version)
+                    self.snapshot = self.loader(version)
+                    self.built = now
+            except Exception as e:
+                if self.snapshot is None:
+                    raise
+                # keep serving the last good snapshot, retry after check_seconds
+                logger.warning(
+                    "Could not refresh %s snapshot, keep version %s: %s",
+                    self.name,
+                    self.snapshot.version,
+                    e,
+                )
+            self.checked = now
+        return self.snapshot
+
+    def patch(self, version):
+        """
+        Bring snapshot to version by patching changed documents
+
+        :return: False if snapshot has to be rebuilt
+        """
+        if self.snapshot.version == version:
+            return True
+        if self.patcher is None or self.snapshot.version > version:
+            return False
+        ids = get_changed_ids(self.name, self.snapshot.version, version)
+        if ids is None:
+            return False
+        logger.info(
+            "Patch %s snapshot to version %s with %s documents",
+            self.name,
+            version,
+            len(ids),
+        )
+        self.snapshot = self.patcher(self.snapshot, version, ids)
+        return True
+
+    async def on_change(self, events):
+        """
+        Bump version for change stream events and refresh snapshot before next request.
+
+        Every API worker sees every event, only the worker claiming an event bumps for it.
+        """
+        events = await claim_events(events)
+        if events:
+            ids = set()
+            for event in events:
+                if "documentKey" not in event:
+                    # drop, rename or invalidate of the collection
+                    ids = None
+                    break
+                ids.add(event["documentKey"]["_id"])
+            await bump_version_async(self.name, ids=ids)
+        self.invalidate()
+        await self.get_async()
+
+    async def get_async(self, force=False):
+        """Get current snapshot, checking version in thread pool only when due"""
+        if not force and not self.due():
+            return self.snapshot
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get, force)
@@ -0,0 +1,124 @@
+"""Offline Zip Code Centroid Table to resolve bare Zip Codes without Geocoding"""
+import os
+import re
+import bz2
+import csv
+import json
+import logging
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("zip_centroids")
+
+ZIP_CENTROIDS_FILE = os.getenv("ZIP_CENTROIDS_FILE", "/data/zip_centroids.npy")
+# Census ZCTA Gazetteer file, e.g. 2020_Gaz_zcta_national.txt
+ZIP_GAZETTEER_FILE = os.getenv("ZIP_GAZETTEER_FILE", "/data/zcta_gazetteer.txt")
+# zips.json.bz2 bundled with the zipcodes==1.2.0 package, source of the committed table
+ZIP_CODES_FILE = os.getenv("ZIP_CODES_FILE", "/data/zips.json.bz2")
+ZIP_DTYPE = np.dtype([("zip", "<i4"), ("lat", "<f8"), ("lon", "<f8")])
+ZIP_RE = re.compile(r"^\d{5}$")
+
+_ZIP_CENTROIDS = {}
+
+
+class ZipCentroids:
+    """Sorted Zip -> (lat, lon) table, looked up with binary search"""
+
+    def __init__(self, table):
+        self.table = table
+        self.zips = table["zip"]
+
+    @classmethod
+    def load(cls, path=ZIP_CENTROIDS_FILE):
+        """Memory-map table from .npy file"""
+        return cls(np.load(path, mmap_mode="r"))
+
+    def __len__(self):
+        return len(self.zips)
+
+    def lookup(self, zip_code):
+        """
+        Get Lat/Lon of Zip Code centroid
+
+        :param zip_code: 5 digit zip code
+        :return: tuple of (lat, lon) or None if not in table
+        """
+        zip_code = int(zip_code)
+        i = int(np.searchsorted(self.zips, zip_code))
+        if i < len(self.zips) and self.zips[i] == zip_code:
+            row = self.table[i]
+            return float(row["lat"]), float(row["lon"])
+        return None
+
+
+def read_gazetteer(gazetteer=ZIP_GAZETTEER_FILE):
+    """Zip, lat, lon rows of tab delimited Census ZCTA Gazetteer file"""
+    rows = []
+    with open(gazetteer, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f, delimiter="\t")
+        header = [h.strip() for h in next(reader)]
+        zip_i = header.index("GEOID")
+        lat_i = header.index("INTPTLAT")
+        lon_i = header.index("INTPTLONG")
+        for row in reader:
+            rows.append((int(row[zip_i]), float(row[lat_i]), float(row[lon_i])))
+    return rows
+
+
+def read_zip_codes(zip_codes=ZIP_CODES_FILE):
+    """Zip, lat, lon rows of active non military zip codes with coordinates in zipcodes data"""
+    with bz2.open(zip_codes, "rt", encoding="utf-8") as f:
+        zips = json.load(f)
+    rows = {}
+    for z in zips:
+        if not z["active"] or z["zip_code_type"] == "MILITARY":
+            continue
+        lat, lon = float(z["lat"]), float(z["long"])
+        if lat == 0 and lon == 0:
+            continue
+        rows[int(z["zip_code"])] = (int(z["zip_code"]), lat, lon)
+    return list(rows.values())
+
+
+def build_table(rows, out=ZIP_CENTROIDS_FILE):
+    """Build sorted .npy table from zip, lat, lon rows"""
+    table = np.array(rows, dtype=ZIP_DTYPE)
+    table.sort(order="zip")
+    np.save(out, table)
+    logger.info("Built zip centroid table of %s zip codes to %s", len(table), out)
+
+
+def get_zip_centroids():
+    """Load Zip Centroids table once per process, None if there is no table"""
+    if "table" not in _ZIP_CENTROIDS:
+        try:
+            _ZIP_CENTROIDS["table"] = ZipCentroids.load()
+            logger.info("Loaded %s zip centroids", len(_ZIP_CENTROIDS["table"]))
+        except (OSError, ValueError) as e:
+            logger.warning("No zip centroid table, will geocode zip codes: %s", str(e))
+            _ZIP_CENTROIDS["table"] = None
+    return _ZIP_CENTROIDS["table"]
+
+
+def zip_lat_lon(address):
+    """Lat/Lon of address if it is a bare 5 digit zip code found in table, else None"""
+    address = str(address).strip()
+    if not ZIP_RE.match(address):
+        return None
+    table = get_zip_centroids()
+    if table is None:
+        return None
+    return table.lookup(address)
+
+
+if __name__ == "__main__":
+    if os.path.exists(ZIP_GAZETTEER_FILE):
+        build_table(read_gazetteer())
+    elif os.path.exists(ZIP_CODES_FILE):
+        build_table(read_zip_codes())
+    else:
+        logger.info(
+            "No Gazetteer file at %s or zip codes file at %s, skip zip centroids",
+            ZIP_GAZETTEER_FILE,
+            ZIP_CODES_FILE,
+        )
@@ -5,6 +5,7 @@ import datetime
 
 import os
 import io
+import asyncio
 import secrets
 import uuid
 import logging
@@ -18,15 +19,22 @@ from fastapi import (
     Request,
 )
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from fastapi_limiterx import FastAPILimiter
 from fastapi_limiterx.depends import RateLimiter
 from fastapi_paginate import Page, add_pagination
 from fastapi_paginate.ext.motor import paginate
-import aioredis
-from cosine_search.top_results import GetTopNResults
-from db.mongo_connector import MongoConnector, MongoConnectorAsync
+from cosine_search.scorers import SCORERS, get_scorer
+from cosine_search.top_results import GetTopNResultsAsync, get_top_results_batch
+from cosine_search.snapshot import SERVICES_SNAPSHOT, QUESTIONS_SNAPSHOT
+from cosine_search.result_cache import RESULT_CACHE
+from db.mongo_connector import MongoConnectorAsync, MongoClients
 from db.consts import DB_SERVICES, get_lat_lon, EXAMPLE_RESULTS
+from db.zip_centroids import get_zip_centroids
+from db.versions import bump_version_async
+from db.redis_cache import RedisCache, create_redis, close_redis
+from db.change_watcher import ChangeWatcher
+from db.tags import tag_counts_async
 from db.neo import BaseNeo
 from models import (
     PDFResponse,
@@ -35,16 +43,24 @@ from models import (
     FullServices,
     Disconnected,
     TopNResults,
+    TopNRequest,
+    TopNBatchResult,
+    TopNBatchError,
     QuestionOut,
+    TagVocabulary,
     D3Response,
     ServiceOut,
 )
-from mongo_utils import send_user_data, send_ip_address_mongo
+from mongo_utils import (
+    send_user_data,
+    send_user_data_batch,
+    send_ip_address_mongo,
+    ANALYTICS,
+)
 from pdf_gen import generate_pdf
 
 # from fasttext import TextModel
 
-REDIS_NAME = "pocas_redis"
 description = """
 # POCAS SERVICE API
  * Can get all services in API
@@ -67,6 +83,7 @@ app.include_router(temp, prefix="/api/v1")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("MHP_API")
 mongo_client = MongoConnectorAsync().client
+WATCHER = ChangeWatcher(DB_SERVICES["db"], [SERVICES_SNAPSHOT, QUESTIONS_SNAPSHOT])
 
 # TEXT_MODEL = TextModel()
 # TEXT_MODEL.load_recent_model()
@@ -74,9 +91,28 @@ mongo_client = MongoConnectorAsync().client
 
 @app.on_event("startup")
 async def startup():
-    """Redis Startup for FASTAPI Limiter"""
-    redis = await aioredis.from_url(f"redis://{REDIS_NAME}", port=6379)
-    await FastAPILimiter.init(redis)
+    """
+    Shared Redis pool for FASTAPI Limiter and caches, load Zip Centroids and default scorer,
+    start Analytics writer and snapshot change stream watcher
+    """
+    # fail on start instead of on every top_n call if SCORER env is unknown
+    get_scorer()
+    app.state.redis = await create_redis()
+    await FastAPILimiter.init(app.state.redis)
+    app.state.cache = RedisCache(app.state.redis)
+    RESULT_CACHE.init(app.state.cache.child("top_n"))
+    get_zip_centroids()
+    ANALYTICS.start()
+    WATCHER.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop watcher, flush Analytics and close shared Mongo clients and Redis pool"""
+    await WATCHER.stop()
+    await ANALYTICS.stop()
+    MongoClients.close()
+    await close_redis(app.state.redis)
 
 
 def get_current_username(credentials: HTTPBasicCredentials = Depends(security)):
@@ -100,20 +136,54 @@ def get_current_username(credentials: HTTPBasicCredentials = Depends(security)):
     return credentials.username
 
 
+def get_cache(request: Request) -> RedisCache:
+    """Shared RedisCache of app for handlers, use `child` for a namespace"""
+    return request.app.state.cache
+
+
+async def snapshot_response(request: Request, snapshot, etag):
+    """Pre-encoded JSON of all services in snapshot, gzipped if client accepts it"""
+    if len(snapshot) == 0:
+        raise HTTPException(status_code=404, detail="Services not found")
+    headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    gzipped = "gzip" in request.headers.get("accept-encoding", "")
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    # body is built on the first unfiltered request of a snapshot, off the event loop
+    loop = asyncio.get_running_loop()
+    content = await loop.run_in_executor(None, snapshot.response_body, gzipped)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
 @app.get(
     "/api/v1/services",
     response_model=FullServices,
     dependencies=[Depends(RateLimiter(times=50, seconds=5))],
 )
 async def get_services(
+    request: Request,
+    response: Response,
     tag: Optional[str] = None,
     city: Optional[str] = None,
     max_distance: Optional[int] = 100,
     text: Optional[str] = None,
 ):
     """
-    Get all Services for POCAS
+    Get all Services for POCAS. Without city, served from the in-memory services snapshot with ETag.
     """
+    if not city:
+        snapshot = await SERVICES_SNAPSHOT.get_async()
+        etag = snapshot.etag(tag)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        if not tag:
+            return await snapshot_response(request, snapshot, etag)
+        results = snapshot.filter_tag(tag)
+        if len(results) == 0:
+            raise HTTPException(status_code=404, detail="Services not found")
+        response.headers["ETag"] = etag
+        return {"services": results, "num_of_services": len(results)}
+
     m = MongoConnectorAsync()
     query = {}
 
@@ -186,6 +256,40 @@ async def get_questions():
     return await paginate(mongo_client.results.questions)
 
 
+TAGS_CACHE_TTL = int(os.getenv("TAGS_CACHE_TTL", "86400"))
+
+
+@app.get(
+    "/api/v1/tags",
+    response_model=TagVocabulary,
+    dependencies=[Depends(RateLimiter(times=50, seconds=5))],
+)
+async def get_tag_vocabulary(cache: RedisCache = Depends(get_cache)):
+    """
+    Get all Service and Question tags with the number of documents of each tag,
+    cached per services and questions snapshot content
+    """
+    services, questions = await asyncio.gather(
+        SERVICES_SNAPSHOT.get_async(), QUESTIONS_SNAPSHOT.get_async()
+    )
+    tags_cache = cache.child("tags")
+    key = (f"s{services.digest}", f"q{questions.digest}")
+    response = await tags_cache.get(*key)
+    if response is not None:
+        return response
+    service_tags, question_tags = await asyncio.gather(
+        tag_counts_async(DB_SERVICES["collection"], "general_topic"),
+        tag_counts_async("questions", "main_tag"),
+    )
+    response = {
+        "services": service_tags,
+        "questions": question_tags,
+        "tags": sorted({t["tag"] for t in service_tags + question_tags}),
+    }
+    await tags_cache.set(*key, value=response, ttl=TAGS_CACHE_TTL)
+    return response
+
+
 @app.post(
     "/api/v1/services",
     dependencies=[
@@ -204,6 +308,9 @@ async def post_new_service(service: Service):
     mongo_id = await m.upload_results(
         db=DB_SERVICES["db"], collection=DB_SERVICES["collection"], data=[payload]
     )
+    await bump_version_async(
+        DB_SERVICES["collection"], ids=[i for i in mongo_id if i != "Duplicate!"]
+    )
     return {"id": str(mongo_id[0])}
 
 
@@ -217,9 +324,9 @@ async def post_new_service(service: Service):
 )
 async def check_zone(address: str):
     """Check if User is within zone of results"""
-    gtr = GetTopNResults(top_n=1, dob="03011900", answers=[], address=address)
-    gtr.get_lat_lon()
-    check = gtr.find_radius()
+    gtr = GetTopNResultsAsync(top_n=1, dob="03011900", answers=[], address=address)
+    await gtr.get_lat_lon()
+    check = await gtr.find_radius()
     return {"radius_status": check}
 
 
@@ -231,7 +338,7 @@ async def check_zone(address: str):
 )
 async def delete_service(_id: str, service_id: str):
     """Delete Service Recommended from MHP. Used when user deletes a card on frontend UI"""
-    m = MongoConnector()
+    m = MongoConnectorAsync()
     db = "platform"
     collection = "user_data"
     if not _id or _id == "None":
@@ -240,13 +347,22 @@ async def delete_service(_id: str, service_id: str):
         )
     try:
         c = m.client[db][collection]
-        c.update_one({"name": _id}, {"$pull": {"top_services": service_id}})
+        await c.update_one({"name": _id}, {"$pull": {"top_services": service_id}})
         return {"status": True}
     except Exception as exc:
         logger.warning(exc)
         raise HTTPException(status_code=500, detail="Could not delete") from exc
 
 
+def check_scorer(scorer):
+    """Reject unknown scorer names"""
+    if scorer is not None and scorer not in SCORERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown scorer {scorer}, choose one of {sorted(SCORERS)}",
+        )
+
+
 @app.post(
     "/api/v1/top_n",
     dependencies=[
@@ -261,25 +377,26 @@ async def get_top_results(  # pylint: disable=dangerous-default-value
     dob: int,
     address: str,
     user_name: str = None,
+    radius_check: bool = False,
+    scorer: str = None,
     answers: List[int] = EXAMPLE_RESULTS,
 ):
     """
-    Send questionnaire and get Top N results
+    Send questionnaire and get Top N results, identical questionnaires are served from cache.
+    With `radius_check` also returns `radius_status` from the same geocode and spatial lookup.
+    `scorer` picks the ranking, one of the registered scorers, SCORER env by default.
     """
+    check_scorer(scorer)
     try:
-        m = MongoConnectorAsync()
-        len_quest = await m.query_results_api(
-            db="results", collection="questions", query={}
+        questions = await QUESTIONS_SNAPSHOT.get_async()
+        assert len(answers) == len(questions)
+        gtr = GetTopNResultsAsync(
+            top_n=top_n, dob=dob, answers=answers, address=address, scorer=scorer
         )
-        assert len(answers) == len(len_quest)
-        gtr = GetTopNResults(top_n=top_n, dob=dob, answers=answers, address=address)
-        top_services, user_loc = gtr.get_top_results()
-        for r in top_services:
-            r["id"] = str(r["_id"])
-            r.pop("_id", None)
+        top_services, user_loc = await gtr.get_top_results(questions, RESULT_CACHE)
         assert len(top_services) <= int(top_n)
         result_id = uuid.uuid4().hex
-        send_user_data(dob, address, answers, top_services, result_id)
+        await send_user_data(dob, address, answers, top_services, result_id)
         ip_data = {
             "ip_address": request.client.host,
             "endpoint": "top_n",
@@ -288,18 +405,127 @@ async def get_top_results(  # pylint: disable=dangerous-default-value
         }
         if user_name:
             ip_data["ip_address"] = user_name
-        send_ip_address_mongo([ip_data])
-        return {
+        await send_ip_address_mongo([ip_data])
+        response = {
             "services": top_services,
             "num_of_services": len(top_services),
             "user_loc": user_loc,
             "name": result_id,
         }
+        if radius_check:
+            response["radius_status"] = gtr.radius_status
+        return response
     except Exception as exc:
         logger.warning(exc)
         raise HTTPException(status_code=404, detail="Results not found") from exc
 
 
+TOP_N_BATCH_MAX = int(os.getenv("TOP_N_BATCH_MAX", "1000"))
+TOP_N_BATCH_CHUNK = int(os.getenv("TOP_N_BATCH_CHUNK", "100"))
+
+
+async def top_n_batch_lines(
+    request: Request, top_n, user_name, questionnaires, scorer=None
+):
+    """
+    Score questionnaires in chunks and yield one NDJSON line per questionnaire,
+    analytics of each chunk are written in bulk
+    """
+    questions = await QUESTIONS_SNAPSHOT.get_async()
+    for start in range(0, len(questionnaires), TOP_N_BATCH_CHUNK):
+        chunk = questionnaires[start : start + TOP_N_BATCH_CHUNK]
+        lines = {}
+        gtrs = {}
+        for index, questionnaire in enumerate(chunk, start=start):
+            try:
+                assert len(questionnaire.answers) == len(questions)
+                gtrs[index] = GetTopNResultsAsync(
+                    top_n=top_n,
+                    dob=questionnaire.dob,
+                    answers=questionnaire.answers,
+                    address=questionnaire.address,
+                    scorer=scorer,
+                )
+            except Exception as exc:
+                logger.warning(exc)
+                lines[index] = TopNBatchError(index=index, detail="Results not found")
+        try:
+            results = await get_top_results_batch(list(gtrs.values()), questions)
+        except Exception as exc:
+            logger.warning(exc)
+            results = [None] * len(gtrs)
+
+        user_data = []
+        ip_data = []
+        for index, result in zip(gtrs, results):
+            if result is None:
+                lines[index] = TopNBatchError(index=index, detail="Results not found")
+                continue
+            top_services, user_loc = result
+            result_id = uuid.uuid4().hex
+            questionnaire = chunk[index - start]
+            user_data.append(
+                (
+                    questionnaire.dob,
+                    questionnaire.address,
+                    questionnaire.answers,
+                    top_services,
+                    result_id,
+                )
+            )
+            ip_data.append(
+                {
+                    "ip_address": user_name or request.client.host,
+                    "endpoint": "top_n/batch",
+                    "date": datetime.datetime.now(),
+                    "name": result_id,
+                }
+            )
+            lines[index] = TopNBatchResult(
+                index=index,
+                services=top_services,
+                num_of_services=len(top_services),
+                user_loc=user_loc,
+                name=result_id,
+                radius_status=gtrs[index].radius_status,
+            )
+        await send_user_data_batch(user_data)
+        await send_ip_address_mongo(ip_data)
+        for index in sorted(lines):
+            yield lines[index].json() + "\n"
+
+
+@app.post(
+    "/api/v1/top_n/batch",
+    dependencies=[
+        Depends(get_current_username),
+        Depends(RateLimiter(times=2, seconds=10)),
+    ],
+    response_class=StreamingResponse,
+)
+async def get_top_results_many(
+    request: Request,
+    questionnaires: List[TopNRequest],
+    top_n: int = 15,
+    user_name: str = None,
+    scorer: str = None,
+):
+    """
+    Send many questionnaires and get Top N results of each as NDJSON, one line per questionnaire
+    in order with its `index`. Failed questionnaires get a line with `detail` instead of services.
+    """
+    check_scorer(scorer)
+    if len(questionnaires) > TOP_N_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch can not have more than {TOP_N_BATCH_MAX} questionnaires",
+        )
+    return StreamingResponse(
+        top_n_batch_lines(request, top_n, user_name, questionnaires, scorer),
+        media_type="application/x-ndjson",
+    )
+
+
 @app.post(
     "/api/v1/pdf",
     dependencies=[Depends(get_current_username)],
@@ -392,4 +618,14 @@ async def get_network():
     return neo.d3_response
 
 
+@app.get(
+    "/api/v1/cache/metrics",
+    dependencies=[Depends(get_current_username)],
+    tags=["alarms"],
+)
+async def get_cache_metrics(cache: RedisCache = Depends(get_cache)):
+    """Hits, misses, sets and errors of each Redis cache namespace"""
+    return cache.metrics.summary()
+
+
 add_pagination(app)
@@ -25,6 +25,9 @@ class Service(BaseModel):
     hours: Optional[str]
     id: Optional[str]
     pocas_score: Optional[float]
+    distance: Optional[float] = Field(
+        example=12.3, description="Miles from user, None for online services"
+    )
 
 
 class ServiceOut(Service):
@@ -71,6 +74,21 @@ class QuestionList(BaseModel):
     questions: List[Question]
 
 
+class TagCount(BaseModel):
+    """Tag with number of documents tagged"""
+
+    tag: str
+    count: int
+
+
+class TagVocabulary(BaseModel):
+    """Tags of Services and Questions with counts"""
+
+    services: List[TagCount]
+    questions: List[TagCount]
+    tags: List[str]
+
+
 class UserLocation(BaseModel):
     """User Location Model"""
 
@@ -85,6 +103,28 @@ class TopNResults(BaseModel):
     num_of_services: int
     user_loc: UserLocation
     name: str = Field(example=uuid.uuid4().hex)
+    radius_status: Optional[bool]
+
+
+class TopNRequest(BaseModel):
+    """One Questionnaire of Batch Top N"""
+
+    dob: int = Field(example=3011990)
+    address: str = Field(example="78724")
+    answers: List[int]
+
+
+class TopNBatchResult(TopNResults):
+    """Top Results of one Questionnaire in Batch, index of request"""
+
+    index: int
+
+
+class TopNBatchError(BaseModel):
+    """Error of one Questionnaire in Batch"""
+
+    index: int
+    detail: str
 
 
 class RadiusZone(BaseModel):
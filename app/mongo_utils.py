@@ -1,44 +1,155 @@
 """Mongo Utils"""
+import os
+import asyncio
 import datetime
 import logging
-from db.mongo_connector import MongoConnector
+from collections import defaultdict
+from db.mongo_connector import MongoConnectorAsync
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mongo_utils")
 
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "100"))
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "2"))
+ANALYTICS_QUEUE_SIZE = int(os.getenv("ANALYTICS_QUEUE_SIZE", "10000"))
 
-def send_user_data(dob, address, answers, services, result_id):
+
+class AnalyticsWriter:
+    """
+    In-process queue of analytics records flushed to Mongo in bulk.
+
+    Records are flushed with unordered insert_many once batch_size records are queued or
+    flush_seconds passed since the first one. When the queue is full `put` waits for the writer.
+    """
+
+    def __init__(
+        self,
+        batch_size=ANALYTICS_BATCH_SIZE,
+        flush_seconds=ANALYTICS_FLUSH_SECONDS,
+        max_size=ANALYTICS_QUEUE_SIZE,
+    ):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_size = max_size
+        self.queue = None
+        self.task = None
+        self.closing = False
+
+    def start(self):
+        """Start background writer on running event loop"""
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self.closing = False
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Flush queued records and stop background writer"""
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+        self.queue = None
+
+    async def put(self, db, collection, records):
+        """Queue records for db/collection, write directly if writer is not running"""
+        if self.task is None:
+            await self.flush([(db, collection, r) for r in records])
+            return
+        for record in records:
+            await self.queue.put((db, collection, record))
+
+    async def next_batch(self):
+        """Wait for first record then collect until batch is full or flush time passes"""
+        loop = asyncio.get_running_loop()
+        batch = []
+        item = await self.queue.get()
+        deadline = loop.time() + self.flush_seconds
+        while item is not None:
+            batch.append(item)
+            timeout = deadline - loop.time()
+            if len(batch) >= self.batch_size or timeout <= 0:
+                return batch
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return batch
+        self.closing = True
+        return batch
+
+    @staticmethod
+    async def flush(batch):
+        """Bulk insert batch grouped by db/collection"""
+        grouped = defaultdict(list)
+        for db, collection, record in batch:
+            grouped[(db, collection)].append(record)
+        m = MongoConnectorAsync()
+        for (db, collection), records in grouped.items():
+            try:
+                await m.client[db][collection].insert_many(records, ordered=False)
+            except Exception as e:
+                logger.warning("Analytics for %s.%s did not send!", db, collection)
+                logger.warning(str(e))
+
+    async def run(self):
+        """Background loop flushing batches until stopped"""
+        while not self.closing:
+            batch = await self.next_batch()
+            if batch:
+                await self.flush(batch)
+
+
+ANALYTICS = AnalyticsWriter()
+
+
+def user_data_record(dob, address, answers, services, result_id):
+    """Platform Analytics record of one top_n result"""
+    service_ids = [service["id"] for service in services]
+    return {
+        "dob": int(str(dob)[-4:]),
+        "zip_code": int(address),
+        "answers": answers,
+        "top_services": service_ids,
+        "time": datetime.datetime.now(),
+        "name": result_id,
+    }
+
+
+async def send_user_data(dob, address, answers, services, result_id):
     """Send data for Platform Analytics"""
     try:
-        service_ids = [service["id"] for service in services]
-
-        data = [
-            {
-                "dob": int(str(dob)[-4:]),
-                "zip_code": int(address),
-                "answers": answers,
-                "top_services": service_ids,
-                "time": datetime.datetime.now(),
-                "name": result_id,
-            }
-        ]
-        m = MongoConnector()
+        data = [user_data_record(dob, address, answers, services, result_id)]
         db = "platform"
         collection = "user_data"
-        m.upload_results(db, collection, data)
+        await ANALYTICS.put(db, collection, data)
     except Exception as e:
         logger.warning("Send User data did not send!")
         logger.warning(dob)
         logger.warning(str(e))
 
 
-def send_ip_address_mongo(data):
+async def send_user_data_batch(results):
+    """
+    Send data of many results for Platform Analytics
+
+    :param results: list of tuples of (dob, address, answers, services, result_id)
+    """
+    data = []
+    for result in results:
+        try:
+            data.append(user_data_record(*result))
+        except Exception as e:
+            logger.warning("Send User data did not send!")
+            logger.warning(result[0])
+            logger.warning(str(e))
+    await ANALYTICS.put("platform", "user_data", data)
+
+
+async def send_ip_address_mongo(data):
     """Send IP address for IP Analytics"""
     try:
-        m = MongoConnector()
         db = "analytics"
         collection = "ip_hits"
-        m.upload_results(db, collection, data)
+        await ANALYTICS.put(db, collection, data)
     except Exception as e:
         logger.warning(str(e))
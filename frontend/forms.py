@@ -13,34 +13,54 @@ from wtforms import (
     SelectField,
 )
 from wtforms.validators import InputRequired, EqualTo, Length, Email, NumberRange
-import pandas as pd
 from frontend.consts import API_URL  # pylint: disable=import-error
+from frontend.models.flask_models import cache  # pylint: disable=import-error
 from frontend.setup_logging import logger
 
+QUESTIONS_TIMEOUT = 60
+TAGS_TIMEOUT = 300
+TAGS_CACHE_KEY = "service_tags"
+
 CITY_CHOICES = ["", "Tucson, AZ"]
 
 
 def get_tags():
-    """Get Tags from POCAS API and get unique ones"""
+    """
+    Get Service Tags from POCAS API tag vocabulary.
+
+    Fetched on first use and cached across requests for TAGS_TIMEOUT, a failed fetch is not
+    cached so the next render tries again.
+    """
+    values = cache.get(TAGS_CACHE_KEY)
+    if values is not None:
+        return values
     try:
-        services_resp = requests.get(f"{API_URL}services", timeout=5)
-        services = pd.DataFrame(services_resp.json()["services"])
-        g_t = services.general_topic.dropna().unique().tolist()
-        tags = services.tags.explode().dropna().unique().tolist()
-        values = set(g_t + tags)
-        values = sorted(values)
-    except requests.exceptions.RequestException as e:
-        raise SystemExit(e) from e
+        tags_resp = requests.get(f"{API_URL}tags", timeout=5)
+        tags_resp.raise_for_status()
+        values = [t["tag"] for t in tags_resp.json()["services"]]
     except Exception as e:
         logger.warning(str(e), exc_info=True)
-        values = []
+        return []
+    cache.set(TAGS_CACHE_KEY, values, timeout=TAGS_TIMEOUT)
     return values
 
 
+@cache.memoize(timeout=QUESTIONS_TIMEOUT)
+def get_questions():
+    """Get Questions from POCAS API, cached across requests, failed responses raise and are not cached"""
+    questions_resp = requests.get(f"{API_URL}questions", timeout=3)
+    questions_resp.raise_for_status()
+    return questions_resp.json()
+
+
 class Tags(FlaskForm):
-    """Form to filter by tags in services map"""
+    """Form to filter by tags in services map, choices are set per form from cached tags"""
+
+    tags = SelectMultipleField("Filter by Tags", choices=[])
 
-    tags = SelectMultipleField("Filter by Tags", choices=get_tags())
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tags.choices = get_tags()
 
 
 class EditForm(FlaskForm):
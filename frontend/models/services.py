@@ -22,6 +22,7 @@ class Service:
     hours = None
     id = None
     pocas_score = 0.5
+    distance = None
     sms_payload = None
 
     def __init__(self, service):
@@ -34,6 +34,7 @@ from frontend.forms import (  # pylint: disable=import-error
     ChangePassForm,
     Tags,
     get_tags,
+    get_questions,
     SearchServices,
 )  # pylint: disable=import-error
 from frontend.consts import API_URL  # pylint: disable=import-error
@@ -171,7 +172,7 @@ def filter_tags():
 @login_required
 def home_page():
     """Home Page with Questions"""
-    questions = requests.get(f"{API_URL}questions", timeout=3).json()
+    questions = get_questions()
 
     for q in questions["items"]:
         setattr(Questions, "question_" + str(q["id"]), SwitchField(q["question"]))
@@ -192,15 +193,14 @@ def home_page():
         s = requests.Session()
         s.auth = (os.getenv("API_USER"), os.getenv("API_PASS"))
 
-        post_radius_check = s.post(f"{API_URL}radius_check?address={address}")
-        radius_check = post_radius_check.json()
         post_questions = s.post(
-            f"{API_URL}top_n?top_n=15&dob={dob}&address={address}&user_name={current_user.user_name}",
+            f"{API_URL}top_n?top_n=15&dob={dob}&address={address}"
+            f"&user_name={current_user.user_name}&radius_check=true",
             json=answers,
         )
         payload = post_questions.json()
         logger.debug(len(payload["services"]))
-        if not radius_check["radius_status"]:
+        if not payload.get("radius_status"):
             flash(
                 "Patient not within 200 miles of any services in MHP Database!",
                 "warning",